@@ -1,60 +1,313 @@
+import argparse
+import codecs
 import csv
+import gzip
+import hashlib
 import io
+import math
 import os
 import re
+import shutil
+import tempfile
 import threading
+import time
 from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from flask import Flask, Response, jsonify, render_template, request, send_file
+from flask.json.provider import DefaultJSONProvider
+from openpyxl import Workbook
+
+from order_management.cache import table_cache
+from order_management.changes import ChangeFeed
+from order_management.imports import ImportJobs
+from order_management.keys import KeyIndex
+from order_management.metrics import cascade, metrics, phase
+from order_management.prices import PriceIndex
+from order_management.records import Record
+from order_management.rollups import GROUPS, PERIODS, SalesRollup
+from order_management.search import OrderIndex
+from order_management.storage import (
+    CUSTOMERS_FIELDS,
+    ORDERS_FIELDS,
+    PRICE_LISTS_FIELDS,
+    PRODUCTS_FIELDS,
+    open_storage,
+)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Serializes table records as the dicts of strings they stand for."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        with phase('serialize'):
+            return super().dumps(obj, **kwargs)
 
-from flask import Flask, jsonify, render_template, request, send_file
-from openpyxl import Workbook, load_workbook
 
 app = Flask(__name__)
-
-DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-PRODUCTS_FILE = os.path.join(DATA_DIR, 'products.csv')
-CUSTOMERS_FILE = os.path.join(DATA_DIR, 'customers.csv')
-ORDERS_FILE = os.path.join(DATA_DIR, 'orders.csv')
-
-PRICE_LISTS_FILE = os.path.join(DATA_DIR, 'price_lists.csv')
-PRICE_LISTS_FIELDS = ['id', 'name']
-PRODUCTS_FIELDS = ['id', 'list_id', 'name', 'unit', 'price']
-CUSTOMERS_FIELDS = ['id', 'name', 'list_id']
-ORDERS_FIELDS = ['id', 'date', 'customer', 'product', 'unit', 'price', 'quantity', 'total']
+app.json = JSONProvider(app)
+
+DATA_DIR = os.environ.get('WEB_ORDER_DATA_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# 存储后端: csv（默认）或 sqlite
+STORAGE_BACKEND = os.environ.get('WEB_ORDER_STORAGE', 'csv')
+SQLITE_FILE = os.environ.get('WEB_ORDER_DB') or os.path.join(DATA_DIR, 'orders.db')
+# 多个进程共用数据目录时（如 gunicorn -w N）设为 1
+SHARED_STORAGE = os.environ.get('WEB_ORDER_SHARED', '') in ('1', 'true', 'yes')
+# CSV 后端在数据目录的 snapshots/ 下保存解析后的表，重启时直接加载；设为 0 关闭
+SNAPSHOTS = os.environ.get('WEB_ORDER_SNAPSHOTS', '1') in ('1', 'true', 'yes')
+# 慢请求采样分析：按比例对请求运行 cProfile，超过阈值的写入目录
+metrics.profile_sample = float(os.environ.get('WEB_ORDER_PROFILE_SAMPLE') or 0)
+metrics.profile_slow_ms = float(os.environ.get('WEB_ORDER_PROFILE_SLOW_MS') or 500)
+metrics.profile_dir = os.environ.get('WEB_ORDER_PROFILE_DIR') or \
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'log', 'profiles')
 VALID_UNITS = ['套', '个']
-
-lock = threading.Lock()
+# Columns that must be unique within each table. Orders have none and are
+# looked up by id through order_index.
+UNIQUE_KEYS = {
+    'price_lists': ('name',),
+    'products': ('list_id', 'name', 'unit'),
+    'customers': ('name',),
+}
+
+store = None
+order_index = None
+sales_rollup = None
+price_index = None
+rows_by_key = None
+change_feed = None
+import_jobs = ImportJobs()
+
+
+def init_storage(backend=STORAGE_BACKEND, data_dir=DATA_DIR, db_path=SQLITE_FILE,
+                 shared=SHARED_STORAGE, snapshots=SNAPSHOTS, warm=False):
+    """Open the storage backend and attach the in-memory indexes to it.
+
+    ``warm`` loads the tables in a background thread, so requests are
+    served right away and the first ones that need a table wait only for
+    what is left to load.
+    """
+    global store, order_index, sales_rollup, price_index, rows_by_key, change_feed
+    store = open_storage(backend, data_dir, db_path, shared, snapshots)
+    rows_by_key = {name: KeyIndex(getattr(store, name), fields) for name, fields in UNIQUE_KEYS.items()}
+    order_index = OrderIndex(store.orders)
+    sales_rollup = SalesRollup(store.orders)
+    price_index = PriceIndex(store.products, store.customers)
+    change_feed = ChangeFeed(store)
+    if warm:
+        threading.Thread(target=store.warm, name='warm', daemon=True).start()
+    return store
+
+
+@app.before_request
+def start_timer():
+    metrics.start()
+
+
+@app.teardown_request
+def record_timing(exc):
+    # Runs after every after_request hook, so compression is included.
+    # Streamed bodies (the CSV export) are produced after this point.
+    metrics.finish(request.method, request.endpoint or 'unmatched')
+
+
+_init_lock = threading.Lock()
+
+
+@app.before_request
+def sync_storage():
+    # Opened here on the first request when main(), serve or the bench has
+    # not opened it yet (e.g. under gunicorn): importing this module must
+    # not touch the data directory.
+    if store is None:
+        with _init_lock:
+            if store is None:
+                init_storage()
+    # Other worker processes may have changed the tables since the last request.
+    store.sync()
 
 
 def ensure_data_dir():
     os.makedirs(DATA_DIR, exist_ok=True)
 
 
-def read_csv(filepath, fields):
-    if not os.path.exists(filepath):
-        return []
-    with open(filepath, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+# --- Conditional requests / compression ---
 
+# JSON and HTML bodies at least this large are gzipped for clients that accept it.
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+GZIP_MIMETYPES = {'application/json', 'text/html'}
+# A gzipped body is a different representation, so it gets its own strong ETag.
+GZIP_ETAG_SUFFIX = '-gz'
+
+
+def _versions(*names):
+    return [getattr(store, name).version() for name in names]
 
-def write_csv(filepath, fields, rows):
-    with open(filepath, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fields, restval='', extrasaction='ignore')
-        writer.writeheader()
-        writer.writerows(rows)
 
+def _conditional(versions, build):
+    """Respond with ``build()``, or 304 if the client's copy is current.
 
-def next_id(rows):
-    if not rows:
-        return 1
-    return max(int(r['id']) for r in rows) + 1
+    ``versions`` are the ``(tag, mtime)`` pairs of everything the response
+    is built from. They are read before ``build`` runs, so a write that
+    lands in between only makes the ETag look older than the body.
+    """
+    key = '\n'.join([request.full_path] + [tag for tag, _ in versions])
+    etag = hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()
+    mtimes = [mtime for _, mtime in versions]
+    last_modified = max(mtimes) if mtimes and None not in mtimes else None
+
+    # Only the ETag is trusted for 304s: Last-Modified has one-second
+    # resolution and would hide a second write within the same second.
+    matched = next((t for t in (etag, etag + GZIP_ETAG_SUFFIX)
+                    if request.if_none_match.contains_weak(t)), None)
+    if matched is not None:
+        resp = Response(status=304)
+        resp.set_etag(matched)
+        # Same Vary as the 200 that compress_response gives these bodies,
+        # so caches keep the gzipped and plain copies apart.
+        resp.vary.add('Accept-Encoding')
+    else:
+        resp = build()
+        if not isinstance(resp, Response):
+            resp = jsonify(resp)
+        resp.set_etag(etag)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+@app.after_request
+def compress_response(resp):
+    if resp.mimetype not in GZIP_MIMETYPES or resp.status_code != 200 \
+            or resp.direct_passthrough or resp.is_streamed \
+            or 'Content-Encoding' in resp.headers:
+        return resp
+    resp.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return resp
+    body = resp.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return resp
+    with phase('compress'):
+        resp.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    resp.headers['Content-Encoding'] = 'gzip'
+    etag, weak = resp.get_etag()
+    if etag:
+        resp.set_etag(etag + GZIP_ETAG_SUFFIX, weak)
+    return resp
+
+
+# --- Batches ---
+
+# Most create/update/delete items one batch request may carry.
+BATCH_MAX = 5000
+
+
+def _batch_items():
+    """Parse a batch body ``{"create": [...], "update": [...], "delete": [...]}``.
+
+    Returns ``((create, update, delete), error)``.
+    """
+    data = request.json
+    if not isinstance(data, dict):
+        return None, '无数据'
+    items = tuple(data.get(op) or [] for op in ('create', 'update', 'delete'))
+    if not all(isinstance(i, list) for i in items):
+        return None, 'create、update、delete 必须是数组'
+    if not any(items):
+        return None, '无数据'
+    if sum(map(len, items)) > BATCH_MAX:
+        return None, f'一次最多提交 {BATCH_MAX} 项'
+    return items, None
+
+
+def _batch_id(value):
+    # JSON true/false would otherwise pass as ids 1 and 0.
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _apply_batch(name, items, new_row, changed_row, not_found, duplicate=None):
+    """Check every item of a batch, then apply them all in one write.
+
+    ``new_row(data)`` and ``changed_row(old, data)`` return ``(row, error)``
+    like ``_new_order``. Items are checked against the table and against
+    each other, including the ``UNIQUE_KEYS`` of the table (``duplicate``
+    is the error for those). If any item fails nothing is written and the
+    400 response lists the errors by operation and position; otherwise the
+    response has the created rows, the updated rows and the deleted ids,
+    in request order.
+    """
+    create, update, delete = items
+    table, index = getattr(store, name), rows_by_key.get(name, order_index)
+    errors, inserts, updates, deletes, seen = [], [], [], [], set()
+    # New rows do not depend on the table, and building one may read other
+    # tables (order prices come from the price index): do it before
+    # locking, so no other table is locked after this one.
+    for i, data in enumerate(create):
+        row, error = new_row(data)
+        if error:
+            errors.append({'op': 'create', 'index': i, 'error': error})
+        inserts.append(row)
+    with store.locked(name):
+        for op, values in (('update', update), ('delete', delete)):
+            for i, data in enumerate(values):
+                rid = _batch_id(data.get('id') if isinstance(data, dict) else None) \
+                    if op == 'update' else _batch_id(data)
+                row, error = None, None
+                if rid is None:
+                    error = 'id 无效'
+                elif rid in seen:
+                    error = '同一条记录在本批中出现了多次'
+                elif index.get(rid) is None:
+                    error = not_found
+                elif op == 'update':
+                    row, error = changed_row(index.get(rid), data)
+                seen.add(rid)
+                if error:
+                    errors.append({'op': op, 'index': i, 'error': error})
+                elif op == 'update':
+                    updates.append(row)
+                else:
+                    deletes.append(rid)
+        if name in UNIQUE_KEYS and not errors:
+            errors = _key_conflicts(index, UNIQUE_KEYS[name], inserts, updates, deletes, duplicate)
+        if errors:
+            return jsonify({'error': f'批量操作未执行：{len(errors)} 项有误', 'errors': errors}), 400
+        inserted, _, _ = table.batch(inserts, updates, deletes)
+    return jsonify({'create': inserted, 'update': updates, 'delete': deletes})
+
+
+def _key_conflicts(index, fields, inserts, updates, deletes, message):
+    # Rows updated or deleted by the batch give up the keys they hold now.
+    released = {int(r['id']) for r in updates} | set(deletes)
+    claimed, errors = set(), []
+    for op, rows in (('create', inserts), ('update', updates)):
+        for i, row in enumerate(rows):
+            key = tuple('' if row.get(f) is None else str(row[f]) for f in fields)
+            if key in claimed or index.holders(*key) - released:
+                errors.append({'op': op, 'index': i, 'error': message})
+            claimed.add(key)
+    return errors
 
 
 # --- Price Lists ---
 
 @app.route('/api/pricelists', methods=['GET'])
 def get_pricelists():
-    return jsonify(read_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS))
+    return _conditional(_versions('price_lists'), store.price_lists.all)
 
 
 @app.route('/api/pricelists', methods=['POST'])
@@ -62,14 +315,11 @@ def add_pricelist():
     data = request.json
     if not data or not data.get('name'):
         return jsonify({'error': '清单名称不能为空'}), 400
-    with lock:
-        rows = read_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS)
+    with store.locked('price_lists'):
         name = data['name'].strip()
-        if any(r['name'] == name for r in rows):
+        if rows_by_key['price_lists'].taken(name):
             return jsonify({'error': '清单名称已存在'}), 400
-        row = {'id': next_id(rows), 'name': name}
-        rows.append(row)
-        write_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS, rows)
+        row = store.price_lists.insert({'name': name})
     return jsonify(row), 201
 
 
@@ -78,102 +328,136 @@ def update_pricelist(plid):
     data = request.json
     if not data:
         return jsonify({'error': '无数据'}), 400
-    with lock:
-        rows = read_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS)
-        for r in rows:
-            if int(r['id']) == plid:
-                if 'name' in data:
-                    new_name = data['name'].strip()
-                    if new_name != r['name'] and any(
-                        x['name'] == new_name for x in rows if int(x['id']) != plid
-                    ):
-                        return jsonify({'error': '清单名称已存在'}), 400
-                    r['name'] = new_name
-                write_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS, rows)
-                return jsonify(r)
-        return jsonify({'error': '清单不存在'}), 404
+    with store.locked('price_lists'):
+        r = rows_by_key['price_lists'].get(plid)
+        if not r:
+            return jsonify({'error': '清单不存在'}), 404
+        r = dict(r)
+        if 'name' in data:
+            new_name = data['name'].strip()
+            if new_name != r['name'] and rows_by_key['price_lists'].taken(new_name, rid=plid):
+                return jsonify({'error': '清单名称已存在'}), 400
+            r['name'] = new_name
+        store.price_lists.update(r)
+        return jsonify(r)
 
 
 @app.route('/api/pricelists/<int:plid>', methods=['DELETE'])
 def delete_pricelist(plid):
-    with lock:
-        rows = read_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS)
-        new_rows = [r for r in rows if int(r['id']) != plid]
-        if len(new_rows) == len(rows):
+    with store.locked('price_lists', 'products'):
+        if not store.price_lists.delete(plid):
             return jsonify({'error': '清单不存在'}), 404
-        write_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS, new_rows)
         # Cascade: delete products in this list
-        products = read_csv(PRODUCTS_FILE, PRODUCTS_FIELDS)
-        products = [p for p in products if str(p.get('list_id', '')) != str(plid)]
-        write_csv(PRODUCTS_FILE, PRODUCTS_FIELDS, products)
-    return jsonify({'ok': True})
+        with cascade('delete_pricelist') as c:
+            ids = [p.id for p in price_index.products_in(plid)]
+            c.rows = len(store.products.batch(deletes=ids)[2])
+    return jsonify({'ok': True, 'products_deleted': c.rows})
 
 
 @app.route('/api/pricelists/<int:plid>/copy', methods=['POST'])
 def copy_pricelist(plid):
-    with lock:
-        lists = read_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS)
-        source = None
-        for l in lists:
-            if int(l['id']) == plid:
-                source = l
-                break
+    with store.locked('price_lists', 'products'):
+        source = rows_by_key['price_lists'].get(plid)
         if not source:
             return jsonify({'error': '清单不存在'}), 404
-        new_list = {'id': next_id(lists), 'name': source['name'] + '(副本)'}
-        lists.append(new_list)
-        write_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS, lists)
-
-        products = read_csv(PRODUCTS_FILE, PRODUCTS_FIELDS)
-        for sp in [p for p in products if str(p.get('list_id', '')) == str(plid)]:
-            products.append({
-                'id': next_id(products),
+        new_list = store.price_lists.insert({'name': source['name'] + '(副本)'})
+        with cascade('copy_pricelist') as c:
+            c.rows = len(store.products.insert_many([{
                 'list_id': str(new_list['id']),
                 'name': sp['name'],
                 'unit': sp.get('unit', ''),
                 'price': sp.get('price', '0'),
-            })
-        write_csv(PRODUCTS_FILE, PRODUCTS_FIELDS, products)
-    return jsonify(new_list), 201
+            } for sp in price_index.products_in(plid)]))
+    return jsonify({**new_list, 'products_copied': c.rows}), 201
+
+
+# Adjusted prices are rounded half up to this step.
+PRICE_STEP = Decimal('0.01')
+
+
+@app.route('/api/pricelists/<int:plid>/adjust', methods=['POST'])
+def adjust_pricelist(plid):
+    """Change every price in a list by ``percent`` (10 = +10%) or by ``amount``."""
+    data = request.json
+    if not isinstance(data, dict) or ('percent' in data) == ('amount' in data):
+        return jsonify({'error': '请指定 percent 或 amount 其中之一'}), 400
+    try:
+        change = Decimal(str(data.get('percent', data.get('amount'))))
+    except InvalidOperation:
+        change = None
+    if change is None or not change.is_finite():
+        return jsonify({'error': '调整幅度必须是数字'}), 400
+    with store.locked('price_lists', 'products'):
+        if not rows_by_key['price_lists'].get(plid):
+            return jsonify({'error': '清单不存在'}), 404
+        updates = []
+        for p in price_index.products_in(plid):
+            try:
+                price = Decimal(p['price'] or '0')
+                if not price.is_finite():
+                    raise InvalidOperation(p['price'])
+            except InvalidOperation:
+                return jsonify({'error': f'货物“{p["name"]}”的单价不是数字'}), 400
+            price = price * (100 + change) / 100 if 'percent' in data else price + change
+            price = price.quantize(PRICE_STEP, ROUND_HALF_UP)
+            if price < 0:
+                return jsonify({'error': f'货物“{p["name"]}”调整后单价为负数'}), 400
+            updates.append({**p, 'price': format(price.normalize(), 'f')})
+        store.products.batch(updates=updates)
+    return jsonify({'list_id': plid, 'products': updates})
 
 
 # --- Products ---
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    rows = read_csv(PRODUCTS_FILE, PRODUCTS_FIELDS)
     list_id = request.args.get('list_id', '')
     if list_id:
-        rows = [r for r in rows if str(r.get('list_id', '')) == list_id]
-    return jsonify(rows)
+        return _conditional(_versions('products'),
+                            lambda: price_index.products_in(list_id))
+    return _conditional(_versions('products'), store.products.all)
 
 
-@app.route('/api/products', methods=['POST'])
-def add_product():
-    data = request.json
-    if not data or not data.get('name'):
-        return jsonify({'error': '货物名称不能为空'}), 400
+def _new_product(data):
+    """Product row for a create payload, as ``(row, error)``."""
+    if not isinstance(data, dict) or not data.get('name'):
+        return None, '货物名称不能为空'
     if not data.get('list_id'):
-        return jsonify({'error': '请选择货物清单'}), 400
-    unit = data.get('unit', '').strip()
+        return None, '请选择货物清单'
+    unit = str(data.get('unit', '')).strip()
     if unit not in VALID_UNITS:
-        return jsonify({'error': '单位只能是"套"或"个"'}), 400
-    with lock:
-        rows = read_csv(PRODUCTS_FILE, PRODUCTS_FIELDS)
-        name = data['name'].strip()
-        list_id = str(data['list_id'])
-        if any(str(r.get('list_id', '')) == list_id and r['name'] == name
-               and r.get('unit') == unit for r in rows):
+        return None, '单位只能是"套"或"个"'
+    return {
+        'list_id': str(data['list_id']),
+        'name': str(data['name']).strip(),
+        'unit': unit,
+        'price': data.get('price', '0'),
+    }, None
+
+
+def _changed_product(r, data):
+    """Product ``r`` with an update payload applied, as ``(row, error)``."""
+    r = dict(r)
+    new_name = str(data.get('name', r['name'])).strip()
+    new_unit = str(data.get('unit', r.get('unit', ''))).strip()
+    if new_unit not in VALID_UNITS:
+        return None, '单位只能是"套"或"个"'
+    r['name'] = new_name
+    r['unit'] = new_unit
+    if 'price' in data:
+        r['price'] = data['price']
+    return r, None
+
+
+@app.route('/api/products', methods=['POST'])
+def add_product():
+    row, error = _new_product(request.json)
+    if error:
+        return jsonify({'error': error}), 400
+    with store.locked('products'):
+        if rows_by_key['products'].taken(row['list_id'], row['name'], row['unit']):
             return jsonify({'error': '该清单下已存在同名同单位的货物'}), 400
-        row = {
-            'id': next_id(rows),
-            'list_id': list_id,
-            'name': name,
-            'unit': unit,
-            'price': data.get('price', '0'),
-        }
-        rows.append(row)
-        write_csv(PRODUCTS_FILE, PRODUCTS_FIELDS, rows)
+        row = store.products.insert(row)
     return jsonify(row), 201
 
 
@@ -182,36 +466,51 @@ def update_product(pid):
     data = request.json
     if not data:
         return jsonify({'error': '无数据'}), 400
-    with lock:
-        rows = read_csv(PRODUCTS_FILE, PRODUCTS_FIELDS)
-        for r in rows:
-            if int(r['id']) == pid:
-                new_name = data.get('name', r['name']).strip()
-                new_unit = data.get('unit', r.get('unit', '')).strip()
-                if new_unit not in VALID_UNITS:
-                    return jsonify({'error': '单位只能是"套"或"个"'}), 400
-                list_id = str(r.get('list_id', ''))
-                if any(str(x.get('list_id', '')) == list_id and x['name'] == new_name
-                       and x.get('unit') == new_unit
-                       for x in rows if int(x['id']) != pid):
-                    return jsonify({'error': '该清单下已存在同名同单位的货物'}), 400
-                r['name'] = new_name
-                r['unit'] = new_unit
-                if 'price' in data:
-                    r['price'] = data['price']
-                write_csv(PRODUCTS_FILE, PRODUCTS_FIELDS, rows)
-                return jsonify(r)
-        return jsonify({'error': '货物不存在'}), 404
+    propagate = bool(data.get('propagate'))
+    # Finding the orders to rename reads customers (see
+    # _rename_product_orders); locking it here keeps the TABLES order.
+    with store.locked('products', *(['customers', 'orders'] if propagate else [])):
+        old = rows_by_key['products'].get(pid)
+        if not old:
+            return jsonify({'error': '货物不存在'}), 404
+        r, error = _changed_product(old, data)
+        if error:
+            return jsonify({'error': error}), 400
+        if rows_by_key['products'].taken(r['list_id'], r['name'], r['unit'], rid=pid):
+            return jsonify({'error': '该清单下已存在同名同单位的货物'}), 400
+        store.products.update(r)
+        if propagate:
+            r['orders_updated'] = _rename_product_orders(old, r)
+        return jsonify(r)
+
+
+def _rename_product_orders(old, new):
+    # Orders name the product but not its price list: the ones meant are
+    # those of customers on the product's list, with the old unit.
+    if (old.name, old.unit) == (new['name'], new['unit']):
+        return 0
+    with cascade('rename_product') as c:
+        customers = price_index.customers_of(old.list_id)
+        rows = [{**o, 'product': new['name'], 'unit': new['unit']}
+                for o in order_index.referring(product=old.name)
+                if o.unit == old.unit and o.customer in customers]
+        c.rows = len(store.orders.batch(updates=rows)[1])
+    return c.rows
+
+
+@app.route('/api/products/batch', methods=['POST'])
+def batch_products():
+    items, error = _batch_items()
+    if error:
+        return jsonify({'error': error}), 400
+    return _apply_batch('products', items, _new_product, _changed_product, '货物不存在',
+                        duplicate='该清单下已存在同名同单位的货物')
 
 
 @app.route('/api/products/<int:pid>', methods=['DELETE'])
 def delete_product(pid):
-    with lock:
-        rows = read_csv(PRODUCTS_FILE, PRODUCTS_FIELDS)
-        new_rows = [r for r in rows if int(r['id']) != pid]
-        if len(new_rows) == len(rows):
-            return jsonify({'error': '货物不存在'}), 404
-        write_csv(PRODUCTS_FILE, PRODUCTS_FIELDS, new_rows)
+    if not store.products.delete(pid):
+        return jsonify({'error': '货物不存在'}), 404
     return jsonify({'ok': True})
 
 
@@ -219,8 +518,7 @@ def delete_product(pid):
 
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
-    rows = read_csv(CUSTOMERS_FILE, CUSTOMERS_FIELDS)
-    return jsonify(rows)
+    return _conditional(_versions('customers'), store.customers.all)
 
 
 @app.route('/api/customers', methods=['POST'])
@@ -228,18 +526,14 @@ def add_customer():
     data = request.json
     if not data or not data.get('name'):
         return jsonify({'error': '客户名称不能为空'}), 400
-    with lock:
-        rows = read_csv(CUSTOMERS_FILE, CUSTOMERS_FIELDS)
+    with store.locked('customers'):
         name = data['name'].strip()
-        if any(r['name'] == name for r in rows):
+        if rows_by_key['customers'].taken(name):
             return jsonify({'error': '客户名称已存在'}), 400
-        row = {
-            'id': next_id(rows),
+        row = store.customers.insert({
             'name': name,
             'list_id': str(data.get('list_id', '')),
-        }
-        rows.append(row)
-        write_csv(CUSTOMERS_FILE, CUSTOMERS_FIELDS, rows)
+        })
     return jsonify(row), 201
 
 
@@ -248,68 +542,203 @@ def update_customer(cid):
     data = request.json
     if not data:
         return jsonify({'error': '无数据'}), 400
-    with lock:
-        rows = read_csv(CUSTOMERS_FILE, CUSTOMERS_FIELDS)
-        for r in rows:
-            if int(r['id']) == cid:
-                if 'name' in data:
-                    new_name = data['name'].strip()
-                    if new_name != r['name'] and any(
-                        x['name'] == new_name for x in rows if int(x['id']) != cid
-                    ):
-                        return jsonify({'error': '客户名称已存在'}), 400
-                    r['name'] = new_name
-                if 'list_id' in data:
-                    r['list_id'] = str(data['list_id'])
-                write_csv(CUSTOMERS_FILE, CUSTOMERS_FIELDS, rows)
-                return jsonify(r)
-        return jsonify({'error': '客户不存在'}), 404
+    propagate = bool(data.get('propagate'))
+    with store.locked('customers', *(['orders'] if propagate else [])):
+        r = rows_by_key['customers'].get(cid)
+        if not r:
+            return jsonify({'error': '客户不存在'}), 404
+        old_name = r.name
+        r = dict(r)
+        if 'name' in data:
+            new_name = data['name'].strip()
+            if new_name != r['name'] and rows_by_key['customers'].taken(new_name, rid=cid):
+                return jsonify({'error': '客户名称已存在'}), 400
+            r['name'] = new_name
+        if 'list_id' in data:
+            r['list_id'] = str(data['list_id'])
+        store.customers.update(r)
+        if propagate:
+            r['orders_updated'] = 0
+            if r['name'] != old_name:
+                with cascade('rename_customer') as c:
+                    rows = [{**o, 'customer': r['name']} for o in order_index.referring(customer=old_name)]
+                    c.rows = len(store.orders.batch(updates=rows)[1])
+                r['orders_updated'] = c.rows
+        return jsonify(r)
 
 
 @app.route('/api/customers/<int:cid>', methods=['DELETE'])
 def delete_customer(cid):
-    with lock:
-        rows = read_csv(CUSTOMERS_FILE, CUSTOMERS_FIELDS)
-        new_rows = [r for r in rows if int(r['id']) != cid]
-        if len(new_rows) == len(rows):
-            return jsonify({'error': '客户不存在'}), 404
-        write_csv(CUSTOMERS_FILE, CUSTOMERS_FIELDS, new_rows)
+    if not store.customers.delete(cid):
+        return jsonify({'error': '客户不存在'}), 404
     return jsonify({'ok': True})
 
 
+# --- Prices ---
+
+@app.route('/api/prices/resolve', methods=['GET'])
+def resolve_price():
+    customer = request.args.get('customer', '').strip()
+    product = request.args.get('product', '').strip()
+    unit = request.args.get('unit', '').strip()
+    if not customer or not product:
+        return jsonify({'error': '客户和货物不能为空'}), 400
+    found = price_index.resolve(customer, product, unit)
+    if found is None:
+        return jsonify({'error': '客户不存在'}), 404
+    list_id, p = found
+    if p is None:
+        return jsonify({'error': '该客户的货物清单中没有此货物'}), 404
+    return jsonify({
+        'customer': customer,
+        'list_id': list_id,
+        'product_id': p.id,
+        'product': p['name'],
+        'unit': p['unit'],
+        'price': p['price'],
+    })
+
+
+@app.route('/api/catalogue', methods=['GET'])
+def customer_catalogue():
+    customer = request.args.get('customer', '').strip()
+    found = price_index.catalogue(customer)
+    if found is None:
+        return jsonify({'error': '客户不存在'}), 404
+    list_id, products, etag = found
+    # The list version moves only when this list's products change.
+    return _conditional([(etag, None)], lambda: {
+        'customer': customer,
+        'list_id': list_id,
+        'fields': ['id', 'name', 'unit', 'price'],
+        'products': products,
+    })
+
+
 # --- Orders ---
 
+ORDER_PAGE_MAX = 1000
+
+
+def _page_args():
+    """Parse the paging/projection query params shared by the order listings.
+
+    Returns ``(args, error)``. ``args['limit']`` is None when the caller did
+    not ask for paging.
+    """
+    order = request.args.get('order', 'id')
+    if order not in ('id', 'date'):
+        return None, '排序方式只能是 id 或 date'
+    fields = [f for f in request.args.get('fields', '').split(',') if f]
+    unknown = [f for f in fields if f not in ORDERS_FIELDS]
+    if unknown:
+        return None, '未知字段: ' + ','.join(unknown)
+    limit = request.args.get('limit', '')
+    after = request.args.get('after', '')
+    try:
+        limit = min(max(int(limit), 1), ORDER_PAGE_MAX) if limit else None
+        if not after:
+            after = None
+        elif order == 'id':
+            after = int(after)
+        else:
+            date, sep, rid = after.rpartition('|')
+            if not sep:
+                raise ValueError(after)
+            after = (date, int(rid))
+    except ValueError:
+        return None, '无效的分页参数'
+    return {'order': order, 'fields': fields, 'limit': limit, 'after': after}, None
+
+
+def _cursor(key):
+    if key is None:
+        return None
+    return str(key) if isinstance(key, int) else f'{key[0]}|{key[1]}'
+
+
+def _project(rows, fields):
+    if not fields:
+        return rows
+    return [{f: r.get(f, '') for f in fields} for r in rows]
+
+
+def _search_params():
+    return {
+        'customer': request.args.get('customer', ''),
+        'product': request.args.get('product', ''),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+    }
+
+
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
-    rows = read_csv(ORDERS_FILE, ORDERS_FIELDS)
-    return jsonify(rows)
+    args, error = _page_args()
+    if error:
+        return jsonify({'error': error}), 400
+    return _conditional(_versions('orders'), lambda: _list_orders(args))
 
 
-@app.route('/api/orders', methods=['POST'])
-def add_order():
-    data = request.json
-    if not data:
-        return jsonify({'error': '无数据'}), 400
+def _list_orders(args):
+    if args['limit'] is None:
+        return _project(store.orders.all(), args['fields'])
+    rows, count, next_key = order_index.page(
+        order=args['order'], after=args['after'], limit=args['limit'])
+    return {'orders': _project(rows, args['fields']), 'count': count,
+            'next': _cursor(next_key)}
+
+
+def _new_order(data):
+    """Order row for a create payload, as ``(row, error)``."""
+    if not isinstance(data, dict) or not data:
+        return None, '无数据'
     required = ['date', 'customer', 'product', 'quantity']
     for field in required:
         if not data.get(field):
-            return jsonify({'error': f'{field} 不能为空'}), 400
-    price = float(data.get('price', 0))
-    quantity = float(data.get('quantity', 0))
-    with lock:
-        rows = read_csv(ORDERS_FILE, ORDERS_FIELDS)
-        row = {
-            'id': next_id(rows),
-            'date': data['date'].strip(),
-            'customer': data['customer'].strip(),
-            'product': data['product'].strip(),
-            'unit': data.get('unit', '').strip(),
-            'price': str(price),
-            'quantity': str(quantity),
-            'total': str(round(price * quantity, 2)),
-        }
-        rows.append(row)
-        write_csv(ORDERS_FILE, ORDERS_FIELDS, rows)
+            return None, f'{field} 不能为空'
+    customer = str(data['customer']).strip()
+    product = str(data['product']).strip()
+    unit = str(data.get('unit', '')).strip()
+    try:
+        price = float(data.get('price', 0))
+        quantity = float(data['quantity'])
+    except (TypeError, ValueError):
+        return None, '单价和数量必须是数字'
+    return {
+        'date': str(data['date']).strip(),
+        'customer': customer,
+        'product': product,
+        'unit': unit,
+        'price': str(price),
+        'quantity': str(quantity),
+        'total': str(round(price * quantity, 2)),
+    }, None
+
+
+def _changed_order(r, data):
+    """Order ``r`` with an update payload applied, as ``(row, error)``."""
+    r = dict(r)
+    for field in ['date', 'customer', 'product', 'unit']:
+        if field in data:
+            r[field] = str(data[field]).strip()
+    if 'price' in data:
+        r['price'] = str(data['price'])
+    if 'quantity' in data:
+        r['quantity'] = str(data['quantity'])
+    try:
+        r['total'] = str(round(float(r['price']) * float(r['quantity']), 2))
+    except ValueError:
+        return None, '单价和数量必须是数字'
+    return r, None
+
+
+@app.route('/api/orders', methods=['POST'])
+def add_order():
+    row, error = _new_order(request.json)
+    if error:
+        return jsonify({'error': error}), 400
+    row = store.orders.insert(row)
     return jsonify(row), 201
 
 
@@ -318,187 +747,172 @@ def update_order(oid):
     data = request.json
     if not data:
         return jsonify({'error': '无数据'}), 400
-    with lock:
-        rows = read_csv(ORDERS_FILE, ORDERS_FIELDS)
-        for r in rows:
-            if int(r['id']) == oid:
-                for field in ['date', 'customer', 'product', 'unit']:
-                    if field in data:
-                        r[field] = str(data[field]).strip()
-                if 'price' in data:
-                    r['price'] = str(data['price'])
-                if 'quantity' in data:
-                    r['quantity'] = str(data['quantity'])
-                r['total'] = str(round(float(r['price']) * float(r['quantity']), 2))
-                write_csv(ORDERS_FILE, ORDERS_FIELDS, rows)
-                return jsonify(r)
-        return jsonify({'error': '订单不存在'}), 404
+    with store.locked('orders'):
+        r = order_index.get(oid)
+        if not r:
+            return jsonify({'error': '订单不存在'}), 404
+        r, error = _changed_order(r, data)
+        if error:
+            return jsonify({'error': error}), 400
+        store.orders.update(r)
+        return jsonify(r)
+
+
+@app.route('/api/orders/batch', methods=['POST'])
+def batch_orders():
+    items, error = _batch_items()
+    if error:
+        return jsonify({'error': error}), 400
+    return _apply_batch('orders', items, _new_order, _changed_order, '订单不存在')
 
 
 @app.route('/api/orders/<int:oid>', methods=['DELETE'])
 def delete_order(oid):
-    with lock:
-        rows = read_csv(ORDERS_FILE, ORDERS_FIELDS)
-        new_rows = [r for r in rows if int(r['id']) != oid]
-        if len(new_rows) == len(rows):
-            return jsonify({'error': '订单不存在'}), 404
-        write_csv(ORDERS_FILE, ORDERS_FIELDS, new_rows)
+    if not store.orders.delete(oid):
+        return jsonify({'error': '订单不存在'}), 404
     return jsonify({'ok': True})
 
 
 @app.route('/api/orders/search', methods=['GET'])
 def search_orders():
-    customer = request.args.get('customer', '')
-    product = request.args.get('product', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
-
-    rows = read_csv(ORDERS_FILE, ORDERS_FIELDS)
-    results = []
-
+    args, error = _page_args()
+    if error:
+        return jsonify({'error': error}), 400
+    return _conditional(_versions('orders'), lambda: _search_orders(args))
+
+
+def _search_orders(args):
+    total = round(float(sales_rollup.total(**_search_params())), 2)
+    if args['limit'] is None:
+        results = list(filter_orders())
+        return {'orders': _project(results, args['fields']), 'total': total}
+    rows, count, next_key = order_index.page(
+        **_search_params(), order=args['order'], after=args['after'], limit=args['limit'])
+    return {'orders': _project(rows, args['fields']), 'total': total,
+            'count': count, 'next': _cursor(next_key)}
+
+
+@app.route('/api/orders/rollup', methods=['GET'])
+def order_rollup():
+    period = request.args.get('period', 'month')
+    if period not in PERIODS:
+        return jsonify({'error': '统计周期只能是 day、month 或 year'}), 400
+    group = [g for g in request.args.get('group', '').split(',') if g]
+    unknown = [g for g in group if g not in GROUPS]
+    if unknown:
+        return jsonify({'error': '未知分组: ' + ','.join(unknown)}), 400
+    return _conditional(_versions('orders'), lambda: _rollup(period, group))
+
+
+def _rollup(period, group):
+    rows = sales_rollup.query(period, group, **_search_params())
     for r in rows:
-        if customer:
-            try:
-                if not re.search(customer, r['customer']):
-                    continue
-            except re.error:
-                if customer not in r['customer']:
-                    continue
-        if product:
-            if product not in r['product']:
-                continue
-        if date_from:
-            if r['date'] < date_from:
-                continue
-        if date_to:
-            # 支持按年(YYYY)、按月(YYYY-MM)、按日(YYYY-MM-DD)查询
-            # date_to 作为上界，需要包含当天/当月/当年
-            if len(date_to) == 4:
-                if r['date'][:4] > date_to:
-                    continue
-            elif len(date_to) == 7:
-                if r['date'][:7] > date_to:
-                    continue
-            else:
-                if r['date'] > date_to:
-                    continue
-
-        results.append(r)
-
-    total = sum(float(r.get('total', 0)) for r in results)
-    return jsonify({'orders': results, 'total': round(total, 2)})
+        r['total'] = round(float(r['total']), 2)
+        r['quantity'] = float(r['quantity'])
+    return {
+        'period': period,
+        'group': group,
+        'rows': rows,
+        'total': round(sum(r['total'] for r in rows), 2),
+    }
 
 
 # --- Export / Import ---
 
-def filter_orders(rows):
-    """Filter orders by query params, reusing search_orders logic."""
-    customer = request.args.get('customer', '')
-    product = request.args.get('product', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
+def filter_orders():
+    """Yield orders matching the query params, in id order."""
+    return order_index.iter_search(**_search_params())
 
-    results = []
-    for r in rows:
-        if customer:
-            try:
-                if not re.search(customer, r['customer']):
-                    continue
-            except re.error:
-                if customer not in r['customer']:
-                    continue
-        if product:
-            if product not in r['product']:
-                continue
-        if date_from:
-            if r['date'] < date_from:
-                continue
-        if date_to:
-            if len(date_to) == 4:
-                if r['date'][:4] > date_to:
-                    continue
-            elif len(date_to) == 7:
-                if r['date'][:7] > date_to:
-                    continue
-            else:
-                if r['date'] > date_to:
-                    continue
-        results.append(r)
-    return results
+
+EXPORT_CHUNK_ROWS = 1000
 
 
 @app.route('/api/orders/export/csv')
 def export_orders_csv():
-    rows = read_csv(ORDERS_FILE, ORDERS_FIELDS)
-    results = filter_orders(rows)
+    results = filter_orders()
 
-    buf = io.StringIO()
-    writer = csv.DictWriter(buf, fieldnames=ORDERS_FIELDS)
-    writer.writeheader()
-    writer.writerows(results)
+    def generate():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=ORDERS_FIELDS)
+        yield codecs.BOM_UTF8
+        writer.writeheader()
+        for i, r in enumerate(results, 1):
+            writer.writerow(r)
+            if i % EXPORT_CHUNK_ROWS == 0:
+                yield buf.getvalue().encode('utf-8')
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode('utf-8')
 
-    output = io.BytesIO(buf.getvalue().encode('utf-8-sig'))
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    return send_file(output, mimetype='text/csv', as_attachment=True,
-                     download_name=f'orders_{ts}.csv')
+    return Response(generate(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename=orders_{ts}.csv',
+    })
+
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Spooled exports stay in memory up to this size, then move to a temp file.
+XLSX_SPOOL_BYTES = 8 * 1024 * 1024
+NUMERIC_FIELDS = {'price', 'quantity', 'total'}
+# Cells written as numbers. int()/float() alone would also take '1_000',
+# ' 5 ' or 'nan', which are stored text and stay text in the workbook.
+_PLAIN_NUMBER = re.compile(r'-?\d+(\.\d+)?')
+
+
+def _cell(field, value):
+    # price/quantity/total are written as numbers; anything unparsable stays text.
+    if field in NUMERIC_FIELDS and value:
+        value = str(value)
+        match = _PLAIN_NUMBER.fullmatch(value)
+        if match is None:
+            return value
+        if match.group(1) is None:
+            return int(value)
+        number = float(value)
+        if math.isfinite(number):
+            return number
+    return value
+
+
+def _append_rows(wb, title, headers, fields, rows):
+    ws = wb.create_sheet(title)
+    with phase('serialize'):
+        ws.append(headers)
+        for r in rows:
+            ws.append([_cell(f, r.get(f, '')) for f in fields])
 
 
-@app.route('/api/orders/export/excel')
-def export_orders_excel():
-    rows = read_csv(ORDERS_FILE, ORDERS_FIELDS)
-    results = filter_orders(rows)
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = '订单'
-    headers = ['ID', '日期', '客户', '货物', '单位', '单价', '数量', '总价']
-    ws.append(headers)
-    for r in results:
-        ws.append([r.get(f, '') for f in ORDERS_FIELDS])
-
-    buf = io.BytesIO()
-    wb.save(buf)
+def _send_workbook(wb, name):
+    # Not a with block: send_file closes the buffer after the response.
+    buf = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES)  # noqa: SIM115
+    with phase('serialize'):
+        wb.save(buf)
     buf.seek(0)
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    return send_file(buf, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                     as_attachment=True, download_name=f'orders_{ts}.xlsx')
+    return send_file(buf, mimetype=XLSX_MIMETYPE, as_attachment=True,
+                     download_name=f'{name}_{ts}.xlsx')
+
+
+@app.route('/api/orders/export/excel')
+def export_orders_excel():
+    wb = Workbook(write_only=True)
+    _append_rows(wb, '订单', ['ID', '日期', '客户', '货物', '单位', '单价', '数量', '总价'],
+                 ORDERS_FIELDS, filter_orders())
+    return _send_workbook(wb, 'orders')
 
 
 @app.route('/api/data/export')
 def export_all_data():
-    wb = Workbook()
-
-    # Price Lists sheet
-    ws_pl = wb.active
-    ws_pl.title = '货物清单'
-    ws_pl.append(['ID', '名称'])
-    for r in read_csv(PRICE_LISTS_FILE, PRICE_LISTS_FIELDS):
-        ws_pl.append([r.get(f, '') for f in PRICE_LISTS_FIELDS])
-
-    # Products sheet
-    ws_p = wb.create_sheet('货物明细')
-    ws_p.append(['ID', '清单ID', '名称', '单位', '单价'])
-    for r in read_csv(PRODUCTS_FILE, PRODUCTS_FIELDS):
-        ws_p.append([r.get(f, '') for f in PRODUCTS_FIELDS])
-
-    # Customers sheet
-    ws_c = wb.create_sheet('客户')
-    ws_c.append(['ID', '名称', '货物清单ID'])
-    for r in read_csv(CUSTOMERS_FILE, CUSTOMERS_FIELDS):
-        ws_c.append([r.get(f, '') for f in CUSTOMERS_FIELDS])
-
-    # Orders sheet
-    ws_o = wb.create_sheet('订单')
-    ws_o.append(['ID', '日期', '客户', '货物', '单位', '单价', '数量', '总价'])
-    for r in read_csv(ORDERS_FILE, ORDERS_FIELDS):
-        ws_o.append([r.get(f, '') for f in ORDERS_FIELDS])
-
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    return send_file(buf, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                     as_attachment=True, download_name=f'all_data_{ts}.xlsx')
+    wb = Workbook(write_only=True)
+    _append_rows(wb, '货物清单', ['ID', '名称'],
+                 PRICE_LISTS_FIELDS, store.price_lists.all())
+    _append_rows(wb, '货物明细', ['ID', '清单ID', '名称', '单位', '单价'],
+                 PRODUCTS_FIELDS, store.products.all())
+    _append_rows(wb, '客户', ['ID', '名称', '货物清单ID'],
+                 CUSTOMERS_FIELDS, store.customers.all())
+    _append_rows(wb, '订单', ['ID', '日期', '客户', '货物', '单位', '单价', '数量', '总价'],
+                 ORDERS_FIELDS, store.orders.all())
+    return _send_workbook(wb, 'all_data')
 
 
 @app.route('/api/orders/import', methods=['POST'])
@@ -508,76 +922,200 @@ def import_orders():
         return jsonify({'error': '请选择文件'}), 400
 
     filename = f.filename.lower()
-    imported = []
-
     if filename.endswith('.csv'):
-        text = f.read().decode('utf-8-sig')
-        reader = csv.DictReader(io.StringIO(text))
-        for row in reader:
-            imported.append(row)
+        kind = 'csv'
     elif filename.endswith('.xlsx'):
-        wb = load_workbook(f, read_only=True)
-        ws = wb.active
-        headers = [cell.value for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            imported.append(dict(zip(headers, row)))
-        wb.close()
+        kind = 'xlsx'
     else:
         return jsonify({'error': '仅支持 .csv 和 .xlsx 文件'}), 400
 
-    # Map possible header names to internal field names
-    header_map = {
-        'ID': 'id', 'id': 'id',
-        '日期': 'date', 'date': 'date',
-        '客户': 'customer', 'customer': 'customer',
-        '货物': 'product', 'product': 'product',
-        '单位': 'unit', 'unit': 'unit',
-        '单价': 'price', 'price': 'price',
-        '数量': 'quantity', 'quantity': 'quantity',
-        '总价': 'total', 'total': 'total',
-    }
-
-    count = 0
-    with lock:
-        rows = read_csv(ORDERS_FILE, ORDERS_FIELDS)
-        for raw in imported:
-            mapped = {}
-            for k, v in raw.items():
-                if k and k in header_map:
-                    mapped[header_map[k]] = str(v).strip() if v is not None else ''
-            # Validate required fields
-            if not mapped.get('date') or not mapped.get('customer') or not mapped.get('product') or not mapped.get('quantity'):
-                continue
-            price = float(mapped.get('price', 0) or 0)
-            quantity = float(mapped.get('quantity', 0) or 0)
-            row = {
-                'id': next_id(rows),
-                'date': mapped['date'],
-                'customer': mapped['customer'],
-                'product': mapped['product'],
-                'unit': mapped.get('unit', ''),
-                'price': str(price),
-                'quantity': str(quantity),
-                'total': str(round(price * quantity, 2)),
-            }
-            rows.append(row)
-            count += 1
-        if count > 0:
-            write_csv(ORDERS_FILE, ORDERS_FIELDS, rows)
-
-    return jsonify({'ok': True, 'count': count})
+    # The job reads the upload after this request has finished.
+    fd, path = tempfile.mkstemp(prefix='web-order-import-', suffix='.' + kind)
+    with os.fdopen(fd, 'wb') as out:
+        shutil.copyfileobj(f.stream, out)
+    job = import_jobs.start(path, kind, f.filename, store.orders)
+    if request.args.get('wait'):
+        job.done.wait()
+        if job.status == 'failed':
+            return jsonify({'error': job.error, 'job': job.to_dict()}), 400
+        return jsonify({'ok': True, 'count': job.count, 'job': job.to_dict()})
+    return jsonify({'ok': True, 'job': job.to_dict()}), 202
+
+
+@app.route('/api/orders/import/<job_id>')
+def import_status(job_id):
+    job = import_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': '导入任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+
+# --- Change feed ---
+
+# A stream with nothing to send writes a comment this often, so dead
+# connections are noticed and proxies keep it open.
+SSE_HEARTBEAT_S = 15
+# How often a waiting stream checks for writes by other worker processes.
+SSE_SYNC_S = 1.0
+
+
+def _feed_cursor(value):
+    """Parse ``<version>`` or ``<epoch>-<version>`` into ``(epoch, version)``."""
+    epoch, _, version = value.rpartition('-')
+    return epoch or None, int(version)
+
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Changes after ``?since=<version>``; without it, just the current version."""
+    feed = change_feed
+    since = request.args.get('since', '')
+    if not since:
+        return jsonify({'epoch': feed.epoch, 'version': feed.version})
+    try:
+        epoch, version = _feed_cursor(since)
+    except ValueError:
+        return jsonify({'error': '无效的版本号'}), 400
+    changes = feed.since(version, request.args.get('epoch') or epoch)
+    if changes is None:
+        return jsonify({'epoch': feed.epoch, 'version': feed.version, 'reset': True})
+    return jsonify({'epoch': feed.epoch, 'version': changes[-1]['version'] if changes else version,
+                    'changes': changes})
+
+
+@app.route('/api/changes/stream', methods=['GET'])
+def stream_changes():
+    """Server-Sent Events: one ``message`` per change, with ``id`` set to
+    ``<epoch>-<version>`` so a reconnecting ``EventSource`` resumes where
+    it stopped. ``ready`` starts a fresh stream and ``reset`` tells the
+    client it missed changes and must reload.
+    """
+    feed, storage = change_feed, store
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        cursor = _feed_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': '无效的版本号'}), 400
+
+    def event(name, data, version=None):
+        head = f'event: {name}\n' if name else ''
+        if version is not None:
+            head += f'id: {feed.epoch}-{version}\n'
+        return f'{head}data: {app.json.dumps(data)}\n\n'
+
+    def generate():
+        changes = None if cursor is None else feed.since(cursor[1], cursor[0])
+        if changes is None:
+            version = feed.version
+            yield event('ready' if cursor is None else 'reset',
+                        {'epoch': feed.epoch, 'version': version}, version)
+            changes = []
+        else:
+            version = cursor[1]
+        quiet_since = time.monotonic()
+        while not feed.closed:
+            for change in changes:
+                version = change['version']
+                yield event(None, change, version)
+                quiet_since = time.monotonic()
+            if time.monotonic() - quiet_since >= SSE_HEARTBEAT_S:
+                yield ': ping\n\n'
+                quiet_since = time.monotonic()
+            feed.wait(version, SSE_SYNC_S)
+            # Picks up writes from other worker processes; cheap otherwise.
+            storage.sync()
+            changes = feed.since(version)
+            if changes is None:
+                # Fell behind further than the feed keeps.
+                version = feed.version
+                yield event('reset', {'epoch': feed.epoch, 'version': version}, version)
+                changes = []
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    stats = table_cache.stats()
+    if store.snapshots is not None:
+        stats['snapshots'] = store.snapshots.stats()
+    return jsonify(stats)
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    cache = table_cache.stats()
+    extra = [
+        ('web_order_table_cache_hits_total', 'counter', 'Table cache hits.', cache['hits']),
+        ('web_order_table_cache_misses_total', 'counter', 'Table cache misses.', cache['misses']),
+        ('web_order_profiles_written_total', 'counter', 'Slow-request profiles written.',
+         metrics.profiles_written),
+    ]
+    if store.snapshots is not None:
+        snapshots = store.snapshots.stats()
+        extra += [
+            ('web_order_snapshot_loads_total', 'counter', 'CSV files loaded from snapshots.',
+             snapshots['loads']),
+            ('web_order_snapshot_writes_total', 'counter', 'Table snapshots written.',
+             snapshots['writes']),
+        ]
+    text = metrics.render(extra)
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/profiling', methods=['GET', 'PUT'])
+def profiling():
+    # Applies to this worker process only.
+    if request.method == 'PUT':
+        data = request.json or {}
+        try:
+            sample = float(data.get('sample', metrics.profile_sample))
+            slow_ms = float(data.get('slow_ms', metrics.profile_slow_ms))
+        except (TypeError, ValueError):
+            return jsonify({'error': '无效的采样参数'}), 400
+        if not 0 <= sample <= 1 or slow_ms < 0:
+            return jsonify({'error': '采样比例须在 0 到 1 之间，阈值不能为负'}), 400
+        metrics.profile_sample, metrics.profile_slow_ms = sample, slow_ms
+    return jsonify({
+        'sample': metrics.profile_sample,
+        'slow_ms': metrics.profile_slow_ms,
+        'dir': metrics.profile_dir,
+        'written': metrics.profiles_written,
+    })
 
 
 # --- Main page ---
 
 @app.route('/')
 def index():
-    return render_template('index.html')
-
-
-def main():
+    st = os.stat(os.path.join(app.root_path, app.template_folder, 'index.html'))
+    return _conditional([(f'{st.st_mtime_ns:x}.{st.st_size:x}', st.st_mtime)],
+                        lambda: Response(render_template('index.html'), mimetype='text/html'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='web-order', description='订单管理系统')
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help='多进程生产服务器')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=5001)
+    serve.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    bench = commands.add_parser('bench', help='性能基准测试（参数见 web-order bench -h）', add_help=False)
+    bench.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        from order_management.bench import main as run_bench
+        run_bench(args.args)
+        return
     ensure_data_dir()
-    app.run(debug=True, host='127.0.0.1', port=5001)
+    if args.command == 'serve':
+        from order_management.server import serve as run_server
+        run_server(args.host, args.port, args.workers)
+    else:
+        init_storage()
+        app.run(debug=True, host='127.0.0.1', port=5001)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,598 @@
+"""Benchmarks for the storage hot paths.
+
+    web-order bench endpoints --sizes 10000,100000 --output run.json
+    web-order bench endpoints --sizes 100000 --baseline run.json
+    web-order bench ids --sizes 1000,2000,4000,8000
+    web-order bench excel --sizes 20000,100000
+    web-order bench startup --sizes 10000,100000
+    web-order bench generate --data-dir /tmp/orders --orders 50000
+
+(``python -m order_management.bench`` takes the same arguments.)
+
+Every benchmark works on a throwaway data directory, never on
+``DATA_DIR``; ``generate`` only writes to the ``--data-dir`` it is given.
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+
+def _client(backend, data_dir):
+    import order_management.app as web
+    # Snapshots are written in the background and would compete with the
+    # requests being timed; ``startup`` measures them on their own.
+    store = web.init_storage(backend, data_dir, os.path.join(data_dir, 'orders.db'), snapshots=False)
+    return web.app.test_client(), store
+
+
+def _orders_csv(n):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(['日期', '客户', '货物', '单位', '单价', '数量'])
+    for i in range(n):
+        writer.writerow([f'2025-09-{i % 28 + 1:02d}', f'客户{i % 50}', f'货物{i % 200}', '个', '1.5', str(i % 9 + 1)])
+    return buf.getvalue().encode('utf-8-sig')
+
+
+def bench_ids(sizes, backend='csv'):
+    """Time bulk import and price-list copy at growing sizes.
+
+    With O(1) id allocation the per-row cost stays flat as ``n`` grows.
+    """
+    results = []
+    for n in sizes:
+        data_dir = tempfile.mkdtemp(prefix='web-order-bench-')
+        try:
+            client, store = _client(backend, data_dir)
+            body = _orders_csv(n)
+            t0 = time.perf_counter()
+            resp = client.post('/api/orders/import?wait=1', content_type='multipart/form-data',
+                               data={'file': (io.BytesIO(body), 'orders.csv')})
+            import_s = time.perf_counter() - t0
+            assert resp.get_json()['count'] == n
+
+            source = store.price_lists.insert({'name': '基准'})
+            store.products.insert_many([
+                {'list_id': str(source['id']), 'name': f'货物{i}', 'unit': '个', 'price': '1'}
+                for i in range(n)])
+            t0 = time.perf_counter()
+            client.post(f'/api/pricelists/{source["id"]}/copy')
+            copy_s = time.perf_counter() - t0
+
+            results.append({
+                'rows': n,
+                'import_s': round(import_s, 4),
+                'import_us_per_row': round(import_s / n * 1e6, 2),
+                'copy_s': round(copy_s, 4),
+                'copy_us_per_row': round(copy_s / n * 1e6, 2),
+            })
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return {'benchmark': 'ids', 'backend': backend, 'results': results}
+
+
+def _max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _legacy_orders_xlsx(rows):
+    # The export as it was before write-only mode: every cell kept in memory.
+    from openpyxl import Workbook
+
+    from order_management.storage import ORDERS_FIELDS
+    wb = Workbook()
+    ws = wb.active
+    ws.title = '订单'
+    ws.append(['ID', '日期', '客户', '货物', '单位', '单价', '数量', '总价'])
+    for r in rows:
+        ws.append([r.get(f, '') for f in ORDERS_FIELDS])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return len(buf.getvalue())
+
+
+def _excel_child(variant, backend, data_dir):
+    client, store = _client(backend, data_dir)
+    rows = store.orders.all()
+    client.get('/api/orders/search?customer=_')
+    base = _max_rss_mb()
+    t0 = time.perf_counter()
+    if variant == 'workbook':
+        size = _legacy_orders_xlsx(rows)
+    else:
+        size = len(client.get('/api/orders/export/excel').get_data())
+    return {
+        'wall_s': round(time.perf_counter() - t0, 3),
+        'peak_rss_delta_mb': round(_max_rss_mb() - base, 1),
+        'bytes': size,
+    }
+
+
+def bench_excel(sizes, backend='csv'):
+    """Compare the in-memory ``Workbook()`` export with the write-only one.
+
+    Each variant runs in a fresh process so peak RSS is measured in isolation.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for n in sizes:
+        data_dir = tempfile.mkdtemp(prefix='web-order-bench-')
+        try:
+            _, store = _client(backend, data_dir)
+            store.orders.insert_many([
+                {'date': f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}', 'customer': f'客户{i % 50}',
+                 'product': f'货物{i % 200}', 'unit': '个', 'price': '1.5',
+                 'quantity': str(i % 9 + 1), 'total': str((i % 9 + 1) * 1.5)}
+                for i in range(n)])
+            row = {'rows': n}
+            for variant in ('workbook', 'write_only'):
+                with ctx.Pool(1) as pool:
+                    row[variant] = pool.apply(_excel_child, (variant, backend, data_dir))
+            results.append(row)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return {'benchmark': 'excel', 'backend': backend, 'results': results}
+
+
+def _startup_child(data_dir, snapshots):
+    from order_management.storage import open_storage
+    t0 = time.perf_counter()
+    store = open_storage('csv', data_dir, snapshots=snapshots)
+    store.warm()
+    return {
+        'wall_s': round(time.perf_counter() - t0, 3),
+        'orders': len(store.orders.all()),
+        'snapshot_loads': store.snapshots.loads if snapshots else 0,
+    }
+
+
+def _size_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return round(total / (1024 * 1024), 2)
+
+
+def bench_startup(sizes, backend='csv'):
+    """Time loading every CSV table in a fresh process, by parsing the
+    files and from their snapshots.
+    """
+    if backend != 'csv':
+        sys.exit('startup 只适用于 csv 后端')
+    from order_management.storage import open_storage
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for n in sizes:
+        data_dir = tempfile.mkdtemp(prefix='web-order-bench-')
+        try:
+            generate(open_storage('csv', data_dir), orders=n)
+            store = open_storage('csv', data_dir, snapshots=True)
+            store.warm()
+            store.snapshots.flush()
+            row = {'rows': n}
+            for variant, snapshots in (('csv', False), ('snapshot', True)):
+                with ctx.Pool(1) as pool:
+                    row[variant] = pool.apply(_startup_child, (data_dir, snapshots))
+            row['csv_mb'] = round(_size_mb(data_dir) - _size_mb(store.snapshots.directory), 2)
+            row['snapshot_mb'] = _size_mb(store.snapshots.directory)
+            results.append(row)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return {'benchmark': 'startup', 'backend': backend, 'results': results}
+
+
+# --- Synthetic data ---
+
+_COMPANY_PREFIXES = '华鑫东永宏嘉中利盛恒泰金新兴德隆祥瑞丰安顺明辉远'
+_COMPANY_TRADES = ['塑胶', '印刷', '电器', '家具', '陶瓷', '玩具', '鞋业', '纺织', '五金',
+                   '食品', '包装', '电子', '服饰', '灯饰', '文具', '化工']
+_COMPANY_SITES = ['', '一厂', '二厂', '分公司', '商行']
+_GOODS = ['纸箱', '泡沫箱', '气泡膜', '透明胶带', '珍珠棉', '缠绕膜', '打包带', '封箱胶',
+          '牛皮纸', '标签纸', '塑料袋', '木托盘', '彩盒', '飞机盒', '防潮袋']
+_SIZES = ['', '10寸', '20寸', '25寸', '27寸', '32寸', '40寸', '大号', '中号', '小号']
+_LIST_NAMES = ['标准价格', 'VIP价格', '批发价格', '专属价格', '促销价格']
+
+
+def _names(rng, n, make):
+    """``n`` distinct names from ``make(rng)``, numbered once they run out."""
+    seen = set()
+    names = []
+    while len(names) < n:
+        name = make(rng)
+        if name in seen:
+            name = f'{name}{len(names) + 1}'
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def _company(rng):
+    return ''.join(rng.sample(_COMPANY_PREFIXES, 2)) + rng.choice(_COMPANY_TRADES) + \
+        rng.choice(_COMPANY_SITES)
+
+
+def _goods(rng):
+    return rng.choice(_SIZES) + rng.choice(_GOODS)
+
+
+def generate(store, price_lists=5, products=200, customers=100, orders=10000,
+             months=12, seed=1, chunk=10000):
+    """Fill ``store`` with a synthetic but plausible dataset.
+
+    Every price list carries ``products`` goods in the units of
+    ``VALID_UNITS``, customers are spread over the lists, and orders are
+    spread over the last ``months`` months, priced from the ordering
+    customer's list. Returns the row counts.
+    """
+    from order_management.app import VALID_UNITS
+    rng = random.Random(seed)
+    lists = store.price_lists.insert_many(
+        [{'name': name} for name in _names(rng, price_lists, lambda r: r.choice(_LIST_NAMES))])
+    goods = _names(rng, products, _goods)
+    catalogue = {}
+    for pl in lists:
+        # Each list prices the same goods, some a little above or below standard.
+        factor = rng.choice([0.8, 0.9, 1.0, 1.0, 1.1])
+        rows = store.products.insert_many([{
+            'list_id': str(pl['id']), 'name': name, 'unit': unit,
+            'price': str(round((1 + i % 40) * 0.5 * factor * (10 if unit == '套' else 1), 2)),
+        } for i, name in enumerate(goods) for unit in VALID_UNITS])
+        catalogue[pl['id']] = rows
+    people = store.customers.insert_many([
+        {'name': name, 'list_id': str(rng.choice(lists)['id'])}
+        for name in _names(rng, customers, _company)])
+
+    today = date.today()
+    days = months * 30
+    count = 0
+    while count < orders:
+        batch = []
+        for _ in range(min(chunk, orders - count)):
+            customer = rng.choice(people)
+            p = rng.choice(catalogue[int(customer['list_id'])])
+            quantity = rng.choice([1, 2, 5, 10, 20, 50, 100, 200, 500])
+            price = float(p['price'])
+            batch.append({
+                'date': (today - timedelta(days=rng.randrange(days))).isoformat(),
+                'customer': customer['name'], 'product': p['name'], 'unit': p['unit'],
+                'price': str(price), 'quantity': str(float(quantity)),
+                'total': str(round(price * quantity, 2)),
+            })
+        store.orders.insert_many(batch)
+        count += len(batch)
+    return {'price_lists': len(lists), 'products': len(lists) * len(goods) * len(VALID_UNITS),
+            'customers': len(people), 'orders': count}
+
+
+# --- Endpoint latency ---
+
+def _percentile(sorted_values, q):
+    # Nearest-rank percentile.
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def _scenarios(store, rng):
+    """``(name, runs_factor, request)`` for every endpoint.
+
+    ``request(client, i)`` makes the i-th call and returns the response;
+    writes clean up after themselves so every run sees the same data.
+    """
+    customers = store.customers.all()
+    lists = store.price_lists.all()
+    some_customer = rng.choice(customers)
+    list_products = [p for p in store.products.all() if p['list_id'] == some_customer['list_id']]
+    some_product = rng.choice(list_products)
+    orders = store.orders.all()
+    last = orders[-1]
+    middle = orders[len(orders) // 2]
+    month = last['date'][:7]
+    prefix = some_customer['name'][:1]
+    import_body = '\n'.join(
+        ['日期,客户,货物,单位,单价,数量'] +
+        [f'{last["date"]},{some_customer["name"]},{some_product["name"]},{some_product["unit"]},'
+         f'{some_product["price"]},{i % 9 + 1}' for i in range(500)]).encode('utf-8-sig')
+    created = {}
+
+    def create_order(c, i):
+        resp = c.post('/api/orders', json={
+            'date': last['date'], 'customer': some_customer['name'],
+            'product': some_product['name'], 'unit': some_product['unit'], 'quantity': '3'})
+        created.setdefault('orders', []).append(resp.get_json()['id'])
+        return resp
+
+    def update_order(c, i):
+        return c.put(f'/api/orders/{created["orders"][i % len(created["orders"])]}',
+                     json={'quantity': str(i % 9 + 1)})
+
+    def delete_order(c, i):
+        return c.delete(f'/api/orders/{created["orders"].pop()}')
+
+    def create_product(c, i):
+        resp = c.post('/api/products', json={
+            'list_id': lists[0]['id'], 'name': f'基准货物{i}', 'unit': '个', 'price': '1'})
+        created.setdefault('products', []).append(resp.get_json()['id'])
+        return resp
+
+    def update_product(c, i):
+        return c.put(f'/api/products/{created["products"][i % len(created["products"])]}',
+                     json={'price': str(i)})
+
+    def delete_product(c, i):
+        return c.delete(f'/api/products/{created["products"].pop()}')
+
+    def create_customer(c, i):
+        resp = c.post('/api/customers', json={'name': f'基准客户{i}', 'list_id': lists[0]['id']})
+        created.setdefault('customers', []).append(resp.get_json()['id'])
+        return resp
+
+    def update_customer(c, i):
+        return c.put(f'/api/customers/{created["customers"][i % len(created["customers"])]}',
+                     json={'list_id': lists[-1]['id']})
+
+    def delete_customer(c, i):
+        return c.delete(f'/api/customers/{created["customers"].pop()}')
+
+    def batch_orders(c, i):
+        # Enters a 20-line order and removes the one entered by the previous call.
+        resp = c.post('/api/orders/batch', json={'create': [{
+            'date': last['date'], 'customer': some_customer['name'], 'product': some_product['name'],
+            'unit': some_product['unit'], 'quantity': str(n % 9 + 1)} for n in range(20)],
+            'delete': created.pop('batch_orders', [])})
+        created['batch_orders'] = [r['id'] for r in resp.get_json()['create']]
+        return resp
+
+    def batch_products(c, i):
+        resp = c.post('/api/products/batch', json={'create': [{
+            'list_id': lists[0]['id'], 'name': f'基准批量货物{i}-{n}', 'unit': '个', 'price': '1'}
+            for n in range(20)], 'delete': created.pop('batch_products', [])})
+        created['batch_products'] = [r['id'] for r in resp.get_json()['create']]
+        return resp
+
+    def adjust_prices(c, i):
+        # Up and back down again, so prices stay where they were.
+        amount = -1 if created.pop('adjusted', False) else 1
+        created['adjusted'] = amount > 0
+        return c.post(f'/api/pricelists/{lists[0]["id"]}/adjust', json={'amount': amount})
+
+    def import_orders(c, i):
+        resp = c.post('/api/orders/import?wait=1', content_type='multipart/form-data',
+                      data={'file': (io.BytesIO(import_body), 'orders.csv')})
+        return resp
+
+    def copy_pricelist(c, i):
+        resp = c.post(f'/api/pricelists/{some_customer["list_id"]}/copy')
+        created.setdefault('lists', []).append(resp.get_json()['id'])
+        return resp
+
+    def delete_pricelist(c, i):
+        return c.delete(f'/api/pricelists/{created["lists"].pop()}')
+
+    renamed = next((cu for cu in customers if cu['name'] != some_customer['name']), some_customer)
+
+    def rename_customer(c, i):
+        # Renames a customer with its order history, and back again.
+        name = renamed['name'] if created.pop('renamed', False) else renamed['name'] + '(改)'
+        created['renamed'] = name != renamed['name']
+        return c.put(f'/api/customers/{renamed["id"]}', json={'name': name, 'propagate': True})
+
+    def recent_changes(c, i):
+        import order_management.app as web
+        return c.get(f'/api/changes?since={max(0, web.change_feed.version - 20)}')
+
+    def etag_of(url):
+        etags = {}
+
+        def get(c, i):
+            if url not in etags:
+                etags[url] = c.get(url).headers.get('ETag')
+            return c.get(url, headers={'If-None-Match': etags[url]})
+        return get
+
+    def get(url):
+        return lambda c, i: c.get(url)
+
+    catalogue = f'/api/catalogue?customer={some_customer["name"]}'
+    resolve = (f'/api/prices/resolve?customer={some_customer["name"]}'
+               f'&product={some_product["name"]}&unit={some_product["unit"]}')
+    return [
+        ('GET /', 1, get('/')),
+        ('GET /api/pricelists', 1, get('/api/pricelists')),
+        ('GET /api/products', 1, get('/api/products')),
+        ('GET /api/products?list_id', 1, get(f'/api/products?list_id={lists[0]["id"]}')),
+        ('GET /api/customers', 1, get('/api/customers')),
+        ('GET /api/catalogue', 1, get(catalogue)),
+        ('GET /api/catalogue (304)', 1, etag_of(catalogue)),
+        ('GET /api/prices/resolve', 1, get(resolve)),
+        ('GET /api/orders', 0.1, get('/api/orders')),
+        ('GET /api/orders (304)', 1, etag_of('/api/orders')),
+        ('GET /api/orders?limit=50', 1, get('/api/orders?limit=50')),
+        ('GET /api/orders?limit=50&order=date', 1,
+         get(f'/api/orders?limit=50&order=date&after={middle["date"]}|0')),
+        ('GET /api/orders/search customer regex', 1,
+         get(f'/api/orders/search?customer=^{prefix}&limit=50')),
+        ('GET /api/orders/search product', 1,
+         get(f'/api/orders/search?product={some_product["name"]}&limit=50')),
+        ('GET /api/orders/search month', 1,
+         get(f'/api/orders/search?date_from={month}&date_to={month}&limit=50')),
+        ('GET /api/orders/search year, full', 0.1,
+         get(f'/api/orders/search?date_from={month[:4]}&date_to={month[:4]}')),
+        ('GET /api/orders/rollup', 1, get('/api/orders/rollup?period=month&group=customer')),
+        ('POST /api/orders', 1, create_order),
+        ('PUT /api/orders', 1, update_order),
+        ('DELETE /api/orders', 1, delete_order),
+        ('POST /api/products', 1, create_product),
+        ('PUT /api/products', 1, update_product),
+        ('DELETE /api/products', 1, delete_product),
+        ('POST /api/customers', 1, create_customer),
+        ('PUT /api/customers', 1, update_customer),
+        ('DELETE /api/customers', 1, delete_customer),
+        ('POST /api/orders/batch 20 lines', 1, batch_orders),
+        ('POST /api/products/batch 20 rows', 1, batch_products),
+        ('POST /api/pricelists/adjust', 1, adjust_prices),
+        ('GET /api/changes?since (last 20)', 1, recent_changes),
+        ('POST /api/pricelists/copy', 1, copy_pricelist),
+        ('DELETE /api/pricelists cascade', 1, delete_pricelist),
+        ('PUT /api/customers rename + orders', 1, rename_customer),
+        ('GET /api/orders/export/csv month', 0.2,
+         get(f'/api/orders/export/csv?date_from={month}&date_to={month}')),
+        ('GET /api/orders/export/csv', 0.05, get('/api/orders/export/csv')),
+        ('GET /api/orders/export/excel month', 0.1,
+         get(f'/api/orders/export/excel?date_from={month}&date_to={month}')),
+        ('GET /api/data/export', 0.02, get('/api/data/export')),
+        ('POST /api/orders/import 500 rows', 0.05, import_orders),
+    ]
+
+
+def _measure(client, request, runs):
+    times = []
+    size = 0
+    status = None
+    for i in range(runs):
+        t0 = time.perf_counter()
+        resp = request(client, i)
+        size = len(resp.get_data())
+        times.append(time.perf_counter() - t0)
+        status = resp.status_code
+        if status >= 400:
+            raise RuntimeError(f'HTTP {status}: {resp.get_data(as_text=True)[:200]}')
+    times.sort()
+    total = sum(times)
+    return {
+        'runs': runs,
+        'status': status,
+        'bytes': size,
+        'p50_ms': round(_percentile(times, 0.5) * 1000, 3),
+        'p99_ms': round(_percentile(times, 0.99) * 1000, 3),
+        'mean_ms': round(total / runs * 1000, 3),
+        'rps': round(runs / total, 1) if total else None,
+    }
+
+
+def _peak_alloc_mb(client, request, i):
+    tracemalloc.start()
+    try:
+        request(client, i).get_data()
+        return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_endpoints(sizes, backend='csv', price_lists=5, products=200, customers=100,
+                    runs=50, seed=1, baseline=None):
+    """p50/p99 latency, throughput and peak allocations for every endpoint.
+
+    Each size is the number of orders in a freshly generated dataset.
+    Every endpoint is called ``runs`` times (fewer for the exports), after
+    one warm-up call that also builds the in-memory indexes; peak
+    allocations come from one more call traced with ``tracemalloc``.
+    """
+    results = []
+    for n in sizes:
+        data_dir = tempfile.mkdtemp(prefix='web-order-bench-')
+        try:
+            client, store = _client(backend, data_dir)
+            t0 = time.perf_counter()
+            counts = generate(store, price_lists, products, customers, n, seed=seed)
+            generate_s = time.perf_counter() - t0
+            endpoints = {}
+            for name, factor, request in _scenarios(store, random.Random(seed)):
+                count = max(3, int(runs * factor))
+                request(client, count)
+                endpoints[name] = _measure(client, request, count)
+                endpoints[name]['peak_alloc_mb'] = _peak_alloc_mb(client, request, count + 1)
+            results.append({'rows': counts, 'generate_s': round(generate_s, 3),
+                            'endpoints': endpoints})
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    report = {
+        'benchmark': 'endpoints',
+        'backend': backend,
+        'python': platform.python_version(),
+        'max_rss_mb': round(_max_rss_mb(), 1),
+        'results': results,
+    }
+    if baseline:
+        _compare(report, baseline)
+    return report
+
+
+def _compare(report, baseline):
+    """Add this run's p50/p99 as a ratio of the baseline's, per endpoint."""
+    with open(baseline, 'r', encoding='utf-8') as f:
+        before = {json.dumps(r['rows'], sort_keys=True): r['endpoints'] for r in json.load(f)['results']}
+    for result in report['results']:
+        old = before.get(json.dumps(result['rows'], sort_keys=True), {})
+        for name, stats in result['endpoints'].items():
+            if name in old and old[name]['p50_ms'] and old[name]['p99_ms']:
+                stats['vs_baseline'] = {
+                    'p50': round(stats['p50_ms'] / old[name]['p50_ms'], 2),
+                    'p99': round(stats['p99_ms'] / old[name]['p99_ms'], 2),
+                }
+
+
+BENCHMARKS = {
+    'endpoints': bench_endpoints,
+    'excel': bench_excel,
+    'ids': bench_ids,
+    'startup': bench_startup,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='web-order bench')
+    parser.add_argument('name', choices=sorted(BENCHMARKS) + ['generate'])
+    parser.add_argument('--sizes', default='1000,2000,4000,8000',
+                        help='comma-separated row counts (orders for endpoints)')
+    parser.add_argument('--backend', default='csv', choices=['csv', 'sqlite'])
+    parser.add_argument('--price-lists', type=int, default=5)
+    parser.add_argument('--products', type=int, default=200, help='goods per price list')
+    parser.add_argument('--customers', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=10000, help='generate only')
+    parser.add_argument('--runs', type=int, default=50, help='calls per endpoint')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', help='generate: directory to fill')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--baseline', help='endpoints: report to compare against')
+    args = parser.parse_args(argv)
+
+    if args.name == 'generate':
+        if not args.data_dir:
+            parser.error('generate needs --data-dir')
+        from order_management.storage import open_storage
+        os.makedirs(args.data_dir, exist_ok=True)
+        store = open_storage(args.backend, args.data_dir)
+        report = generate(store, args.price_lists, args.products, args.customers, args.orders,
+                          seed=args.seed)
+    else:
+        sizes = [int(x) for x in args.sizes.split(',')]
+        options = {'backend': args.backend}
+        if args.name == 'endpoints':
+            options.update(price_lists=args.price_lists, products=args.products,
+                           customers=args.customers, runs=args.runs, seed=args.seed,
+                           baseline=args.baseline)
+        report = BENCHMARKS[args.name](sizes, **options)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
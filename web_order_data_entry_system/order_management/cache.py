@@ -0,0 +1,102 @@
+import os
+import threading
+
+
+class TableCache:
+    """Process-wide cache of parsed CSV tables.
+
+    Entries are keyed by file path and revalidated against the file's
+    mtime/size, so edits made outside the app are picked up on the next read.
+    Writes through the app replace the entry directly instead of dropping it.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    def get(self, filepath):
+        entry = self._entries.get(filepath)
+        try:
+            st = os.stat(filepath)
+        except FileNotFoundError:
+            st = None
+        with self._lock:
+            if entry is not None and st is not None \
+                    and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+                self.hits += 1
+                return list(entry['rows'])
+            self.misses += 1
+            return None
+
+    def loading(self, filepath):
+        """Lock to hold while parsing ``filepath`` into the cache, so
+        threads that miss together parse it once.
+        """
+        with self._lock:
+            lock = self._loading.get(filepath)
+            if lock is None:
+                lock = self._loading[filepath] = threading.Lock()
+            return lock
+
+    def put(self, filepath, rows, st):
+        with self._lock:
+            self.generation += 1
+            self._entries[filepath] = {
+                'rows': rows,
+                'mtime': st.st_mtime_ns,
+                'size': st.st_size,
+                'generation': self.generation,
+            }
+
+    def extend(self, filepath, rows, before, after):
+        """Record rows appended to a file that was at stat ``before``."""
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is None or entry['mtime'] != before.st_mtime_ns or entry['size'] != before.st_size:
+                self._entries.pop(filepath, None)
+                return
+            self.generation += 1
+            entry['rows'].extend(rows)
+            entry['mtime'] = after.st_mtime_ns
+            entry['size'] = after.st_size
+            entry['generation'] = self.generation
+
+    def peek(self, filepath):
+        """Return ``(rows, size)`` of the cached entry without revalidating it."""
+        with self._lock:
+            entry = self._entries.get(filepath)
+            return None if entry is None else (list(entry['rows']), entry['size'])
+
+    def stamped(self, filepath):
+        """Return ``(rows, mtime_ns, size)`` of the cached entry without
+        revalidating it, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(filepath)
+            return None if entry is None else (list(entry['rows']), entry['mtime'], entry['size'])
+
+    def invalidate(self, filepath=None):
+        with self._lock:
+            if filepath is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(filepath, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'generation': self.generation,
+                'tables': {
+                    os.path.basename(path): {'rows': len(e['rows']), 'generation': e['generation']}
+                    for path, e in self._entries.items()
+                },
+            }
+
+
+table_cache = TableCache()
@@ -0,0 +1,100 @@
+import itertools
+import threading
+import uuid
+from collections import deque
+from functools import partial
+
+from order_management.storage import TABLES
+
+# Rows kept for ``since`` queries and reconnecting streams. A client
+# further behind than this is told to reload instead.
+CHANGE_LOG_ROWS = 50_000
+
+
+class ChangeFeed:
+    """Row-level changes to every table, numbered in the order they happened.
+
+    Subscribes to the tables like the indexes do, so every write is seen
+    whichever route made it, cascades, list copies and import jobs
+    included. A change is a dict::
+
+        {'version': 7, 'table': 'orders', 'op': 'update',
+         'rows': [...new rows...], 'old': [...rows before...]}
+
+    ``op`` is ``'insert'`` (``rows`` only), ``'update'`` (both),
+    ``'delete'`` (``old`` only) or ``'reset'`` (neither): the table was
+    reloaded from outside, e.g. rewritten by another worker process, and
+    has to be fetched again.
+
+    Versions count per process and start over on restart; ``epoch`` tells
+    runs apart. ``since`` returns None for a version from another epoch or
+    one older than the changes kept, and the client must reload.
+    """
+
+    def __init__(self, store, max_rows=CHANGE_LOG_ROWS):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.max_rows = max_rows
+        self.closed = False
+        self._log = deque()
+        self._rows = 0
+        # Changes up to this version have been dropped from the log.
+        self._floor = 0
+        self._cond = threading.Condition()
+        self._tags = {}
+        for name in TABLES:
+            table = getattr(store, name)
+            self._tags[name] = table.version()[0]
+            table.subscribe(partial(self._on_change, name, table))
+
+    def _on_change(self, name, table, event, old, new):
+        # Runs under the table's write lock: no waiting on readers here.
+        if event != 'reset' and not old and not new:
+            return
+        tag = table.version()[0]
+        if event == 'reset':
+            # The table cache re-parsing a file that did not change also
+            # resets the indexes; clients need not hear about it.
+            if tag == self._tags[name]:
+                return
+            change = {'table': name, 'op': 'reset'}
+        elif event == 'insert':
+            change = {'table': name, 'op': event, 'rows': new}
+        elif event == 'update':
+            change = {'table': name, 'op': event, 'rows': new, 'old': old}
+        else:
+            change = {'table': name, 'op': event, 'old': old}
+        self._tags[name] = tag
+        size = len(old) + len(new) or 1
+        with self._cond:
+            self.version += 1
+            change['version'] = self.version
+            self._log.append((change, size))
+            self._rows += size
+            while self._rows > self.max_rows and len(self._log) > 1:
+                dropped, dropped_size = self._log.popleft()
+                self._rows -= dropped_size
+                self._floor = dropped['version']
+            self._cond.notify_all()
+
+    def since(self, version, epoch=None):
+        """Changes after ``version``, oldest first, or None to reload."""
+        with self._cond:
+            if (epoch is not None and epoch != self.epoch) \
+                    or not self._floor <= version <= self.version:
+                return None
+            # Versions in the log are consecutive from ``_floor + 1``.
+            return [c for c, _ in itertools.islice(self._log, version - self._floor, None)]
+
+    def wait(self, version, timeout):
+        """Block until there is a change after ``version``, the feed is
+        closed or ``timeout`` seconds pass.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > version or self.closed, timeout)
+
+    def close(self):
+        """Make waiting streams finish, e.g. so a server can shut down."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
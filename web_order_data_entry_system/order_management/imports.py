@@ -0,0 +1,215 @@
+"""Background order import.
+
+The upload is saved to a temporary file and read back as a stream. Rows
+are converted in chunks, in a process pool when there is more than one
+chunk, and each chunk is committed on its own so the write lock is only
+held for one ``insert_many`` at a time.
+"""
+import collections
+import csv
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl import load_workbook
+
+IMPORT_CHUNK_ROWS = 2000
+IMPORT_WORKERS = int(os.environ.get('WEB_ORDER_IMPORT_WORKERS') or min(4, os.cpu_count() or 1))
+IMPORT_JOBS_KEPT = 50
+# Only the first rejections are kept with their reasons; the count is exact.
+REJECTED_KEPT = 1000
+
+# Map possible header names to internal field names
+HEADER_MAP = {
+    'ID': 'id', 'id': 'id',
+    '日期': 'date', 'date': 'date',
+    '客户': 'customer', 'customer': 'customer',
+    '货物': 'product', 'product': 'product',
+    '单位': 'unit', 'unit': 'unit',
+    '单价': 'price', 'price': 'price',
+    '数量': 'quantity', 'quantity': 'quantity',
+    '总价': 'total', 'total': 'total',
+}
+REQUIRED = ('date', 'customer', 'product', 'quantity')
+
+
+def read_chunks(path, kind, size=IMPORT_CHUNK_ROWS):
+    """Yield ``(headers, first_row_number, rows)`` chunks of a saved upload.
+
+    Row numbers count the header as row 1, as a spreadsheet shows them.
+    """
+    if kind == 'csv':
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            yield from _chunked(csv.reader(f), size)
+    else:
+        wb = load_workbook(path, read_only=True)
+        try:
+            yield from _chunked(wb.active.iter_rows(values_only=True), size)
+        finally:
+            wb.close()
+
+
+def _chunked(rows, size):
+    headers = next(rows, None)
+    if headers is None:
+        return
+    headers = list(headers)
+    start = 2
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield headers, start, chunk
+        start += len(chunk)
+
+
+def convert_chunk(chunk):
+    """Validate and convert one chunk; returns ``(rows, rejected)``.
+
+    Runs in the worker processes, so it only touches its arguments.
+    """
+    headers, start, raw_rows = chunk
+    columns = [(i, HEADER_MAP[h]) for i, h in enumerate(headers) if h and h in HEADER_MAP]
+    rows, rejected = [], []
+    for n, raw in enumerate(raw_rows, start):
+        if all(v is None or v == '' for v in raw):
+            continue
+        mapped = {}
+        for i, field in columns:
+            v = raw[i] if i < len(raw) else None
+            mapped[field] = str(v).strip() if v is not None else ''
+        missing = [f for f in REQUIRED if not mapped.get(f)]
+        if missing:
+            rejected.append({'row': n, 'reason': '缺少字段: ' + ', '.join(missing)})
+            continue
+        try:
+            price = float(mapped.get('price', 0) or 0)
+            quantity = float(mapped.get('quantity', 0) or 0)
+        except ValueError:
+            rejected.append({'row': n, 'reason': '单价或数量不是数字'})
+            continue
+        rows.append({
+            'date': mapped['date'],
+            'customer': mapped['customer'],
+            'product': mapped['product'],
+            'unit': mapped.get('unit', ''),
+            'price': str(price),
+            'quantity': str(quantity),
+            'total': str(round(price * quantity, 2)),
+        })
+    return rows, rejected
+
+
+class ImportJob:
+    """Progress of one import, readable while it runs."""
+
+    def __init__(self, filename):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = 'pending'
+        self.processed = 0
+        self.count = 0
+        self.rejected = []
+        self.rejected_count = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        elapsed = 0.0
+        if self.started is not None:
+            elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'processed': self.processed,
+            'count': self.count,
+            'rejected_count': self.rejected_count,
+            'rejected': list(self.rejected),
+            'elapsed_s': round(elapsed, 3),
+            'rows_per_s': round(self.processed / elapsed, 1) if elapsed else 0.0,
+            'error': self.error,
+        }
+
+
+class ImportJobs:
+    """Runs imports on background threads and keeps the recent jobs."""
+
+    def __init__(self, workers=IMPORT_WORKERS, chunk_rows=IMPORT_CHUNK_ROWS):
+        self.workers = workers
+        self.chunk_rows = chunk_rows
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def start(self, path, kind, filename, table):
+        """Import the file at ``path`` into ``table``; the file is removed afterwards."""
+        job = ImportJob(filename)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.done.is_set()]
+            for old in finished[:max(0, len(self._jobs) - IMPORT_JOBS_KEPT)]:
+                del self._jobs[old.id]
+        threading.Thread(target=self._run, args=(job, path, kind, table),
+                         name=f'import-{job.id[:8]}', daemon=True).start()
+        return job
+
+    def _run(self, job, path, kind, table):
+        job.status = 'running'
+        job.started = time.monotonic()
+        try:
+            for rows, rejected in self._convert(read_chunks(path, kind, self.chunk_rows)):
+                table.insert_many(rows)
+                job.count += len(rows)
+                job.rejected_count += len(rejected)
+                job.rejected.extend(rejected[:REJECTED_KEPT - len(job.rejected)])
+                job.processed += len(rows) + len(rejected)
+        except UnicodeDecodeError:
+            job.status, job.error = 'failed', '文件编码错误，请使用 UTF-8'
+        except Exception as e:  # noqa: BLE001
+            # Runs in a background thread: any error has to end up on the
+            # job, or it would stay 'running' forever.
+            job.status, job.error = 'failed', f'导入失败: {e}'
+        else:
+            job.status = 'done'
+        finally:
+            job.finished = time.monotonic()
+            os.remove(path)
+            job.done.set()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _convert(self, chunks):
+        # Yield converted chunks in file order. A single chunk is converted
+        # inline; otherwise a bounded number of chunks is kept in flight.
+        head = list(itertools.islice(chunks, 2))
+        if len(head) < 2 or self.workers < 2:
+            for chunk in itertools.chain(head, chunks):
+                yield convert_chunk(chunk)
+            return
+        pool = self._executor()
+        pending = collections.deque()
+        try:
+            for chunk in itertools.chain(head, chunks):
+                pending.append(pool.submit(convert_chunk, chunk))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
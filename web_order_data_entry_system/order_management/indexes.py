@@ -0,0 +1,63 @@
+import threading
+
+from order_management.metrics import phase
+
+
+class TableIndex:
+    """In-memory state derived from one or more tables.
+
+    Subscribes to ``tables`` and is built lazily: the first query calls
+    ``_ensure_built``, which loads every table and passes the rows to
+    ``_build`` (one list per table, in ``tables`` order). After that each
+    change is applied as it happens, ``_remove`` for every old row and
+    ``_add`` for every new one, and a ``reset`` makes the next query build
+    again.
+
+    Subclasses implement ``_build``, ``_add`` and ``_remove``, and hold
+    ``_lock`` while they read what those maintain.
+    """
+
+    def __init__(self, *tables):
+        self.tables = tables
+        self._lock = threading.RLock()
+        self._built = False
+        self._changes = 0
+        for table in tables:
+            table.subscribe(self._on_change)
+
+    def _ensure_built(self):
+        # Rows are loaded outside our lock: the load may wait for a writer,
+        # and writers call _on_change while they hold the table lock. A
+        # change that lands in between makes the load start over.
+        while not self._built:
+            seen = self._changes
+            loaded = []
+            for table in self.tables:
+                with table.lock.read():
+                    loaded.append(table.all())
+            with self._lock:
+                if not self._built and self._changes == seen:
+                    with phase('index_build'):
+                        self._build(*loaded)
+                    self._built = True
+
+    def _on_change(self, event, old, new):
+        with self._lock:
+            self._changes += 1
+            if event == 'reset':
+                self._built = False
+            if not self._built:
+                return
+            for r in old:
+                self._remove(r)
+            for r in new:
+                self._add(r)
+
+    def _build(self, *rows):
+        raise NotImplementedError
+
+    def _add(self, r):
+        raise NotImplementedError
+
+    def _remove(self, r):
+        raise NotImplementedError
@@ -0,0 +1,61 @@
+from order_management.indexes import TableIndex
+
+
+class KeyIndex(TableIndex):
+    """Rows of one table by id and by a key that should be unique.
+
+    ``fields`` names the key columns, e.g. ``('list_id', 'name', 'unit')``;
+    without it only the id map is kept. Maintained incrementally like
+    every ``TableIndex``, so list copies (``insert_many``) and cascades
+    (``batch``) keep it current.
+    Returned rows are shared: copy them before changing anything.
+    """
+
+    def __init__(self, table, fields=()):
+        self.fields = tuple(fields)
+        super().__init__(table)
+
+    def _build(self, rows):
+        self._rows = {}
+        self._keys = {}
+        for r in rows:
+            self._add(r)
+
+    def _add(self, r):
+        rid = r.id
+        self._rows[rid] = r
+        if self.fields:
+            self._keys.setdefault(tuple(getattr(r, f) for f in self.fields), set()).add(rid)
+
+    def _remove(self, r):
+        rid = r.id
+        r = self._rows.pop(rid, None)
+        if r is None or not self.fields:
+            return
+        key = tuple(getattr(r, f) for f in self.fields)
+        ids = self._keys.get(key)
+        if ids is not None:
+            ids.discard(rid)
+            if not ids:
+                del self._keys[key]
+
+    def get(self, rid):
+        """Return the row with id ``rid``, or None."""
+        self._ensure_built()
+        with self._lock:
+            return self._rows.get(rid)
+
+    def taken(self, *key, rid=None):
+        """Whether a row other than ``rid`` already has this key."""
+        key = tuple('' if v is None else str(v) for v in key)
+        self._ensure_built()
+        with self._lock:
+            ids = self._keys.get(key, ())
+            return any(i != rid for i in ids)
+
+    def holders(self, *key):
+        """Ids of the rows that have this key."""
+        key = tuple('' if v is None else str(v) for v in key)
+        self._ensure_built()
+        with self._lock:
+            return set(self._keys.get(key, ()))
@@ -0,0 +1,140 @@
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process only
+    fcntl = None
+
+from order_management.metrics import phase
+
+
+class SharedState:
+    """Lock file shared by every process that opens the same table.
+
+    ``flock`` on the file serializes writers across processes. The first
+    16 bytes hold the table's ``(generation, epoch)`` counters, mapped into
+    memory so checking them costs no system call: ``generation`` moves on
+    every change, ``epoch`` only when the file is rewritten rather than
+    appended to.
+    """
+
+    SIZE = struct.calcsize('<QQ')
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise RuntimeError('cross-process locking needs fcntl (POSIX only)')
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            st = os.fstat(fd)
+            if st.st_size < self.SIZE:
+                os.ftruncate(fd, self.SIZE)
+            # Counters restart from zero if the file is recreated.
+            self.ident = st.st_ino
+            self._map = mmap.mmap(fd, self.SIZE)
+        finally:
+            os.close(fd)
+
+    def read(self):
+        return struct.unpack_from('<QQ', self._map)
+
+    def bump(self, rewrite):
+        """Record a change; the caller holds the exclusive lock."""
+        generation, epoch = self.read()
+        counters = (generation + 1, epoch + 1 if rewrite else epoch)
+        struct.pack_into('<QQ', self._map, 0, *counters)
+        return counters
+
+    @contextmanager
+    def locked(self, exclusive):
+        # Every holder opens its own descriptor: flock locks belong to the
+        # open file, so two threads of one process still exclude each other.
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            with phase('lock_wait'):
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+
+class RWLock:
+    """Reader/writer lock that prefers writers.
+
+    Any number of threads may hold the read side; the write side is
+    exclusive. Both sides are reentrant, and the thread holding the write
+    side may also read, so a table method called from inside
+    ``Storage.locked`` does not deadlock. A reader must not ask for the
+    write side.
+
+    With a ``SharedState`` the outermost read or write also takes the
+    matching ``flock``, so other processes are excluded as well.
+    """
+
+    def __init__(self, shared=None):
+        self.shared = shared
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+        self._waiting = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        held = getattr(self._local, 'reads', 0)
+        if held or self._writer == threading.get_ident():
+            self._local.reads = held + 1
+            try:
+                yield
+            finally:
+                self._local.reads = held
+            return
+        with phase('lock_wait'), self._cond:
+            while self._writer is not None or self._waiting:
+                self._cond.wait()
+            self._readers += 1
+        self._local.reads = 1
+        try:
+            if self.shared is None:
+                yield
+            else:
+                with self.shared.locked(exclusive=False):
+                    yield
+        finally:
+            self._local.reads = 0
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with phase('lock_wait'), self._cond:
+            outer = self._writer != me
+            if outer:
+                self._waiting += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting -= 1
+                self._writer = me
+            self._depth += 1
+        try:
+            if outer and self.shared is not None:
+                with self.shared.locked(exclusive=True):
+                    yield
+            else:
+                yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._writer = None
+                    self._cond.notify_all()
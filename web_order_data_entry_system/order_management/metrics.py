@@ -0,0 +1,216 @@
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+
+# Latency histogram bucket bounds, in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Slow-request profiles kept on disk; older ones are removed.
+PROFILE_KEEP = 100
+
+_local = threading.local()
+# cProfile can only run one profiler at a time on newer Pythons.
+_profiling = threading.Lock()
+
+
+class _Timer:
+    """Time of one request, split into exclusive phases.
+
+    A phase entered inside another pauses the outer one, so the phase
+    times never overlap and add up to at most the request time.
+    """
+
+    def __init__(self):
+        self.start = self.mark = time.perf_counter()
+        self.phases = {}
+        self.stack = []
+        self.profile = None
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            top = self.stack[-1]
+            self.phases[top] = self.phases.get(top, 0.0) + now - self.mark
+        self.stack.append(name)
+        self.mark = now
+
+    def exit(self):
+        now = time.perf_counter()
+        name = self.stack.pop()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self.mark
+        self.mark = now
+
+
+class phase:
+    """``with phase('read_csv'):`` charges the block to the current request.
+
+    Does nothing outside a request, e.g. in import job threads.
+    """
+
+    __slots__ = ('timer',)
+
+    def __init__(self, name):
+        self.timer = getattr(_local, 'timer', None)
+        if self.timer is not None:
+            self.timer.enter(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.timer is not None:
+            self.timer.exit()
+
+
+class cascade(phase):
+    """``with cascade('rename_customer') as c: ...; c.rows = n`` times a
+    cascade as the request's ``cascade`` phase and adds its duration and
+    the rows it changed to the per-kind totals of ``metrics``.
+    """
+
+    __slots__ = ('kind', 'rows', 'start')
+
+    def __init__(self, kind):
+        super().__init__('cascade')
+        self.kind = kind
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        metrics.record_cascade(self.kind, self.rows, time.perf_counter() - self.start)
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(BUCKETS) and value > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Per-endpoint latency histograms and time per phase, per process.
+
+    ``start`` and ``finish`` bracket a request on its thread; code in
+    between marks its phases with ``phase``. Time not inside any phase is
+    reported as ``other``. Cascades (``cascade``) are also totalled per kind.
+
+    Profiling is off unless ``profile_sample`` is above zero: that share
+    of requests runs under cProfile, and the stats of those slower than
+    ``profile_slow_ms`` are written to ``profile_dir``.
+    """
+
+    def __init__(self, profile_sample=0.0, profile_slow_ms=500, profile_dir='profiles'):
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._phases = {}
+        self._cascades = {}
+        self.profile_sample = profile_sample
+        self.profile_slow_ms = profile_slow_ms
+        self.profile_dir = profile_dir
+        self.profiles_written = 0
+
+    def start(self):
+        timer = _local.timer = _Timer()
+        if self.profile_sample > 0 and random.random() < self.profile_sample \
+                and _profiling.acquire(blocking=False):
+            timer.profile = cProfile.Profile()
+            timer.profile.enable()
+
+    def finish(self, method, endpoint):
+        timer = getattr(_local, 'timer', None)
+        if timer is None:
+            return
+        _local.timer = None
+        elapsed = time.perf_counter() - timer.start
+        if timer.profile is not None:
+            timer.profile.disable()
+            _profiling.release()
+            if elapsed * 1000 >= self.profile_slow_ms:
+                self._dump(timer.profile, method, endpoint, elapsed)
+        other = max(0.0, elapsed - sum(timer.phases.values()))
+        key = (method, endpoint)
+        with self._lock:
+            hist = self._latency.get(key)
+            if hist is None:
+                hist = self._latency[key] = _Histogram()
+            hist.observe(elapsed)
+            for name, seconds in list(timer.phases.items()) + [('other', other)]:
+                pkey = key + (name,)
+                self._phases[pkey] = self._phases.get(pkey, 0.0) + seconds
+
+    def record_cascade(self, kind, rows, seconds):
+        with self._lock:
+            totals = self._cascades.setdefault(kind, [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += rows
+            totals[2] += seconds
+
+    def _dump(self, profile, method, endpoint, elapsed):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        name = re.sub(r'[^\w.-]+', '_', f'{stamp}-{os.getpid()}-{method}-{endpoint}-{elapsed * 1000:.0f}ms')
+        profile.dump_stats(os.path.join(self.profile_dir, name + '.prof'))
+        with self._lock:
+            self.profiles_written += 1
+        dumps = sorted(f for f in os.listdir(self.profile_dir) if f.endswith('.prof'))
+        for old in dumps[:-PROFILE_KEEP]:
+            try:
+                os.remove(os.path.join(self.profile_dir, old))
+            except FileNotFoundError:
+                pass
+
+    def render(self, extra=()):
+        """Prometheus text exposition of everything recorded so far.
+
+        ``extra`` adds ``(name, type, help, value)`` samples.
+        """
+        lines = [
+            '# HELP web_order_request_duration_seconds Request latency per endpoint.',
+            '# TYPE web_order_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            latency = {k: (list(h.counts), h.sum) for k, h in self._latency.items()}
+            phases = dict(self._phases)
+            cascades = {k: list(v) for k, v in self._cascades.items()}
+        for (method, endpoint), (counts, total) in sorted(latency.items()):
+            labels = f'method="{_label(method)}",endpoint="{_label(endpoint)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else repr(bound)
+                lines.append(f'web_order_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'web_order_request_duration_seconds_sum{{{labels}}} {total!r}')
+            lines.append(f'web_order_request_duration_seconds_count{{{labels}}} {cumulative}')
+        lines += [
+            '# HELP web_order_request_phase_seconds_total Request time per endpoint and phase.',
+            '# TYPE web_order_request_phase_seconds_total counter',
+        ]
+        for (method, endpoint, name), seconds in sorted(phases.items()):
+            lines.append(f'web_order_request_phase_seconds_total{{method="{_label(method)}",'
+                         f'endpoint="{_label(endpoint)}",phase="{_label(name)}"}} {seconds!r}')
+        for i, (name, help_text) in enumerate([
+                ('web_order_cascades_total', 'Cascades run, per kind.'),
+                ('web_order_cascade_rows_total', 'Rows changed by cascades, per kind.'),
+                ('web_order_cascade_seconds_total', 'Time spent in cascades, per kind.')]):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for kind, totals in sorted(cascades.items()):
+                lines.append(f'{name}{{kind="{_label(kind)}"}} {totals[i]!r}')
+        for name, kind, help_text, value in extra:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
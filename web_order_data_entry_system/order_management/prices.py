@@ -0,0 +1,129 @@
+import uuid
+
+from order_management.indexes import TableIndex
+from order_management.records import Customer
+
+
+def _key(r):
+    return r.list_id, (r.name, r.unit)
+
+
+class PriceIndex(TableIndex):
+    """Resolves (customer, product name, unit) to a price list entry.
+
+    Keeps customer name -> price list and, per price list, (name, unit) ->
+    products, which also serve as the list -> products relation for
+    cascades. Maintained incrementally from the products and customers
+    tables as a ``TableIndex``. Each price list carries a
+    version that moves whenever one of its products changes, which makes a
+    cheap ETag for the catalogue of a customer.
+    """
+
+    def __init__(self, products, customers):
+        super().__init__(products, customers)
+
+    def _build(self, product_rows, customer_rows):
+        # A new token per build keeps ETags from an older build from matching.
+        self._token = uuid.uuid4().hex[:8]
+        self._lists = {}
+        self._versions = {}
+        self._catalogues = {}
+        self._customers = {}
+        for r in product_rows:
+            self._add_product(r)
+        for r in customer_rows:
+            self._add_customer(r)
+
+    def _add(self, r):
+        if isinstance(r, Customer):
+            self._add_customer(r)
+        else:
+            self._add_product(r)
+
+    def _remove(self, r):
+        if isinstance(r, Customer):
+            self._remove_customer(r)
+        else:
+            self._remove_product(r)
+
+    def _touch(self, list_id):
+        self._versions[list_id] = self._versions.get(list_id, 0) + 1
+        self._catalogues.pop(list_id, None)
+
+    def _add_product(self, r):
+        list_id, key = _key(r)
+        self._lists.setdefault(list_id, {}).setdefault(key, {})[r.id] = r
+        self._touch(list_id)
+
+    def _remove_product(self, r):
+        list_id, key = _key(r)
+        entries = self._lists.get(list_id, {})
+        same = entries.get(key, {})
+        if same.pop(r.id, None) is None:
+            return
+        if not same:
+            del entries[key]
+        if not entries:
+            self._lists.pop(list_id, None)
+        self._touch(list_id)
+
+    def _add_customer(self, r):
+        self._customers.setdefault(r.name, {})[r.id] = r.list_id
+
+    def _remove_customer(self, r):
+        same = self._customers.get(r.name, {})
+        same.pop(r.id, None)
+        if not same:
+            self._customers.pop(r.name, None)
+
+    def _list_of(self, customer):
+        # Customer names are unique; for a duplicate the oldest row wins.
+        same = self._customers.get(customer)
+        return None if not same else same[min(same)]
+
+    def resolve(self, customer, product, unit):
+        """Return ``(list_id, product_row)``, or None for an unknown customer.
+
+        The row is None when the customer's price list has no such product.
+        """
+        self._ensure_built()
+        with self._lock:
+            list_id = self._list_of(customer)
+            if list_id is None:
+                return None
+            same = self._lists.get(list_id, {}).get((product, unit))
+            return list_id, (same[min(same)] if same else None)
+
+    def _products_in(self, list_id):
+        return sorted((r for same in self._lists.get(list_id, {}).values() for r in same.values()),
+                      key=lambda r: r.id)
+
+    def products_in(self, list_id):
+        """Rows of the products in a price list, in id order."""
+        self._ensure_built()
+        with self._lock:
+            return self._products_in(str(list_id))
+
+    def customers_of(self, list_id):
+        """Names of the customers whose price list is ``list_id``."""
+        self._ensure_built()
+        with self._lock:
+            return {name for name in self._customers if self._list_of(name) == str(list_id)}
+
+    def catalogue(self, customer):
+        """Return ``(list_id, products, etag)`` for a customer, or None.
+
+        ``products`` is a list of ``[id, name, unit, price]`` in id order,
+        shared between calls until the price list changes.
+        """
+        self._ensure_built()
+        with self._lock:
+            list_id = self._list_of(customer)
+            if list_id is None:
+                return None
+            products = self._catalogues.get(list_id)
+            if products is None:
+                products = self._catalogues[list_id] = [
+                    [r.id, r.name, r.unit, r['price']] for r in self._products_in(list_id)]
+            etag = f'{self._token}.{list_id}.{self._versions.get(list_id, 0)}'
+            return list_id, products, etag
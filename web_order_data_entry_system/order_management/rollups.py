@@ -0,0 +1,191 @@
+import bisect
+import calendar
+import re
+from decimal import Decimal, InvalidOperation
+
+from order_management.indexes import TableIndex
+from order_management.metrics import phase
+
+# Period key width per granularity; days keep the full date string.
+PERIODS = {'day': None, 'month': 7, 'year': 4}
+GROUPS = ('customer', 'product')
+
+_DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+_DATE_PREFIX = re.compile(r'\d{4}(-\d{2}(-\d{2})?)?$')
+ZERO = Decimal(0)
+
+
+def to_decimal(value):
+    if isinstance(value, Decimal):
+        return value if value.is_finite() else ZERO
+    try:
+        d = Decimal(str(value).strip())
+    except InvalidOperation:
+        return ZERO
+    return d if d.is_finite() else ZERO
+
+
+def _name_filter(names, customer='', product=''):
+    """Distinct customer/product names a search with these filters keeps.
+
+    None means the filter is not set.
+    """
+    customers = products = None
+    if customer:
+        try:
+            match = re.compile(customer).search
+        except re.error:
+            def match(value):
+                return customer in value
+        customers = {c for c in names[0] if match(c)}
+    if product:
+        products = {p for p in names[1] if product in p}
+    return customers, products
+
+
+def _period_range(periods, date_from, date_to, width=None):
+    # Same bound semantics as the order search; bounds are cut to the period
+    # width first when querying month or year keys.
+    if width:
+        date_from, date_to = date_from[:width], date_to[:width]
+    lo = bisect.bisect_left(periods, date_from) if date_from else 0
+    hi = len(periods)
+    if date_to:
+        n = len(date_to) if len(date_to) in (4, 7) else None
+        hi = bisect.bisect_right(periods, date_to, key=lambda p: p[:n])
+    return lo, max(lo, hi)
+
+
+def _starts_period(bound, width):
+    return len(bound) <= width or bound[width:] == '-01-01'[:len(bound) - width]
+
+
+def _ends_period(bound, width):
+    if len(bound) <= width:
+        return True
+    if width == 4:
+        return bound[4:] == '-12-31'[:len(bound) - 4]
+    year, month = int(bound[:4]), int(bound[5:7])
+    return 1 <= month <= 12 and bound[8:] == f'{calendar.monthrange(year, month)[1]:02d}'
+
+
+def _aligned(date_from, date_to, width):
+    """True when both bounds fall on month (7) or year (4) boundaries."""
+    if any(b and not _DATE_PREFIX.match(b) for b in (date_from, date_to)):
+        return False
+    return (not date_from or _starts_period(date_from, width)) and \
+        (not date_to or _ends_period(date_to, width))
+
+
+class _Level:
+    """Totals for one granularity: period -> (customer, product) -> cell."""
+
+    def __init__(self):
+        self.cells = {}
+        self.periods = []
+
+    def add(self, period, key, total, quantity, sign):
+        cells = self.cells.get(period)
+        if cells is None:
+            if sign < 0:
+                return
+            cells = self.cells[period] = {}
+            bisect.insort(self.periods, period)
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = [ZERO, ZERO, 0]
+        cell[0] += sign * total
+        cell[1] += sign * quantity
+        cell[2] += sign
+        if cell[2] <= 0:
+            del cells[key]
+            if not cells:
+                del self.cells[period]
+                del self.periods[bisect.bisect_left(self.periods, period)]
+
+
+class SalesRollup(TableIndex):
+    """Day, month and year sales totals per customer and product.
+
+    Maintained incrementally from the orders table as a ``TableIndex``.
+    Money and quantities are summed as ``Decimal`` so adding and removing
+    orders never drifts.
+    """
+
+    def _build(self, rows):
+        self._levels = {name: _Level() for name in PERIODS}
+        self._names = ({}, {})
+        self._irregular = 0
+        for r in rows:
+            self._apply(r, 1)
+
+    def _add(self, r):
+        self._apply(r, 1)
+
+    def _remove(self, r):
+        self._apply(r, -1)
+
+    def _apply(self, r, sign):
+        date, customer, product = r.date, r.customer, r.product
+        total, quantity = to_decimal(r.total), to_decimal(r.quantity)
+        for name, width in PERIODS.items():
+            self._levels[name].add(date[:width], (customer, product), total, quantity, sign)
+        for names, value in zip(self._names, (customer, product)):
+            names[value] = names.get(value, 0) + sign
+            if not names[value]:
+                del names[value]
+        if not _DATE.match(date):
+            self._irregular += sign
+
+    def _cells(self, level, customer, product, date_from, date_to):
+        width = PERIODS[level]
+        periods = self._levels[level].periods
+        lo, hi = _period_range(periods, date_from, date_to, width)
+        customers, products = _name_filter(self._names, customer, product)
+        for period in periods[lo:hi]:
+            for (c, p), cell in self._levels[level].cells[period].items():
+                if (customers is None or c in customers) and (products is None or p in products):
+                    yield period, c, p, cell
+
+    def total(self, customer='', product='', date_from='', date_to=''):
+        """Sum of ``total`` over the orders a search with these filters finds.
+
+        Uses the coarsest level whose boundaries the date filter lines up
+        with; day keys are full date strings, so that level always does.
+        """
+        self._ensure_built()
+        with phase('filter'), self._lock:
+            level = 'day'
+            if not self._irregular:
+                for name in ('year', 'month'):
+                    if _aligned(date_from, date_to, PERIODS[name]):
+                        level = name
+                        break
+            return sum((cell[0] for *_, cell in self._cells(level, customer, product, date_from, date_to)),
+                       ZERO)
+
+    def query(self, period='month', group=GROUPS, customer='', product='', date_from='', date_to=''):
+        """Aggregate per period and the requested ``group`` columns.
+
+        The date filter selects whole periods that overlap it.
+        """
+        self._ensure_built()
+        with phase('filter'), self._lock:
+            buckets = {}
+            for key, c, p, cell in self._cells(period, customer, product, date_from, date_to):
+                names = {'customer': c, 'product': p}
+                bucket_key = (key,) + tuple(names[g] for g in group)
+                bucket = buckets.get(bucket_key)
+                if bucket is None:
+                    bucket = buckets[bucket_key] = [ZERO, ZERO, 0]
+                bucket[0] += cell[0]
+                bucket[1] += cell[1]
+                bucket[2] += cell[2]
+            result = []
+            for bucket_key in sorted(buckets):
+                total, quantity, count = buckets[bucket_key]
+                item = {'period': bucket_key[0]}
+                item.update(zip(group, bucket_key[1:]))
+                item.update(total=total, quantity=quantity, count=count)
+                result.append(item)
+            return result
@@ -0,0 +1,239 @@
+import bisect
+import re
+
+from order_management.indexes import TableIndex
+from order_management.metrics import phase
+
+
+def date_matches(date, date_from='', date_to=''):
+    if date_from and date < date_from:
+        return False
+    if date_to:
+        # 支持按年(YYYY)、按月(YYYY-MM)、按日(YYYY-MM-DD)查询
+        # date_to 作为上界，需要包含当天/当月/当年
+        if len(date_to) in (4, 7):
+            return date[:len(date_to)] <= date_to
+        return date <= date_to
+    return True
+
+
+def _customer_matcher(customer):
+    # Same rule as the index lookups: a regular expression, or a plain
+    # substring when it does not compile.
+    try:
+        return re.compile(customer).search
+    except re.error:
+        return lambda value: customer in value
+
+
+def _grams(value):
+    grams = set(value)
+    grams.update(value[i:i + 2] for i in range(len(value) - 1))
+    return grams
+
+
+class ValueIndex:
+    """Distinct values of one column mapped to the ids that carry them.
+
+    A character unigram/bigram index over the distinct values answers
+    substring lookups without touching every value.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.grams = {}
+
+    def add(self, value, rid):
+        ids = self.ids.get(value)
+        if ids is None:
+            ids = self.ids[value] = set()
+            for g in _grams(value):
+                self.grams.setdefault(g, set()).add(value)
+        ids.add(rid)
+
+    def remove(self, value, rid):
+        ids = self.ids.get(value)
+        if ids is None:
+            return
+        ids.discard(rid)
+        if not ids:
+            del self.ids[value]
+            for g in _grams(value):
+                values = self.grams[g]
+                values.discard(value)
+                if not values:
+                    del self.grams[g]
+
+    def containing(self, sub):
+        grams = [sub] if len(sub) == 1 else [sub[i:i + 2] for i in range(len(sub) - 1)]
+        sets = sorted((self.grams.get(g, set()) for g in grams), key=len)
+        return [v for v in sets[0] if sub in v]
+
+    def matching(self, pattern):
+        return [v for v in self.ids if pattern.search(v)]
+
+    def ids_for(self, values):
+        result = set()
+        for v in values:
+            result |= self.ids[v]
+        return result
+
+
+class OrderIndex(TableIndex):
+    """In-memory search index over the orders table.
+
+    Keeps the rows by id, sorted id and ``(date, id)`` lists for range
+    queries and keyset paging, and value indexes on customer and product.
+    Maintained incrementally as a ``TableIndex``; a ``reset`` makes it
+    rebuild on the next query.
+    """
+
+    def _build(self, rows):
+        self._rows = {}
+        self._customers = ValueIndex()
+        self._products = ValueIndex()
+        for r in rows:
+            rid = r.id
+            self._rows[rid] = r
+            self._customers.add(r.customer, rid)
+            self._products.add(r.product, rid)
+        self._ids = sorted(self._rows)
+        self._by_date = sorted((r.date, rid) for rid, r in self._rows.items())
+
+    def _add(self, r):
+        rid = r.id
+        self._rows[rid] = r
+        bisect.insort(self._ids, rid)
+        bisect.insort(self._by_date, (r.date, rid))
+        self._customers.add(r.customer, rid)
+        self._products.add(r.product, rid)
+
+    def _remove(self, r):
+        rid = r.id
+        r = self._rows.pop(rid, None)
+        if r is None:
+            return
+        del self._ids[bisect.bisect_left(self._ids, rid)]
+        i = bisect.bisect_left(self._by_date, (r.date, rid))
+        if i < len(self._by_date) and self._by_date[i] == (r.date, rid):
+            del self._by_date[i]
+        self._customers.remove(r.customer, rid)
+        self._products.remove(r.product, rid)
+
+    def get(self, rid):
+        """Return the order with id ``rid``, or None."""
+        self._ensure_built()
+        with self._lock:
+            return self._rows.get(rid)
+
+    def referring(self, customer=None, product=None):
+        """Orders whose customer and/or product is exactly this name, in id order.
+
+        The customer -> orders and product -> orders relations, for
+        carrying a rename over to order history.
+        """
+        self._ensure_built()
+        with self._lock:
+            ids = None
+            for values, name in ((self._customers, customer), (self._products, product)):
+                if name is not None:
+                    found = values.ids.get(name, set())
+                    ids = set(found) if ids is None else ids & found
+            return [self._rows[rid] for rid in sorted(ids or ())]
+
+    def _date_range(self, date_from, date_to):
+        lo = 0
+        if date_from:
+            lo = bisect.bisect_left(self._by_date, date_from, key=lambda e: e[0])
+        hi = len(self._by_date)
+        if date_to:
+            n = len(date_to) if len(date_to) in (4, 7) else None
+            hi = bisect.bisect_right(self._by_date, date_to, key=lambda e: e[0][:n])
+        return lo, max(lo, hi)
+
+    def search(self, customer='', product='', date_from='', date_to=''):
+        """Return the matching orders in id order.
+
+        ``customer`` is a regular expression, falling back to a plain
+        substring when it does not compile; ``product`` is a substring.
+        """
+        self._ensure_built()
+        with phase('filter'), self._lock:
+            return [self._rows[rid] for rid in self._search_ids(customer, product, date_from, date_to)]
+
+    def iter_search(self, customer='', product='', date_from='', date_to=''):
+        """Like ``search`` but yields the rows one at a time.
+
+        The matching ids are fixed when the generator starts; orders deleted
+        while it runs are skipped.
+
+        Until the index is built, a search with a date range reads its rows
+        from ``table.between`` instead, which for a partitioned table reads
+        only the months the range can match. The index is left to the next
+        query that needs it.
+        """
+        if not self._built and (date_from or date_to):
+            yield from self._scan(customer, product, date_from, date_to)
+            return
+        self._ensure_built()
+        with phase('filter'), self._lock:
+            ids = self._search_ids(customer, product, date_from, date_to)
+        for rid in ids:
+            r = self._rows.get(rid)
+            if r is not None:
+                yield r
+
+    def _scan(self, customer, product, date_from, date_to):
+        rows = self.tables[0].between(date_from, date_to)
+        match = _customer_matcher(customer) if customer else None
+        with phase('filter'):
+            return [r for r in rows if (match is None or match(r.customer)) and product in r.product]
+
+    def page(self, customer='', product='', date_from='', date_to='',
+             order='id', after=None, limit=50):
+        """Return one keyset page of matching orders.
+
+        Pages are sorted by id (``order='id'``) or by ``(date, id)``
+        (``order='date'``); ``after`` is the sort key of the last row already
+        seen. Returns ``(rows, count, next_key)`` where ``count`` covers every
+        match and ``next_key`` is None on the last page.
+        """
+        self._ensure_built()
+        with phase('filter'), self._lock:
+            if not (customer or product or date_from or date_to):
+                ids = self._ids
+                keys = ids if order == 'id' else self._by_date
+            else:
+                ids = self._search_ids(customer, product, date_from, date_to)
+                keys = ids if order == 'id' else sorted((self._rows[rid].date, rid) for rid in ids)
+            start = 0 if after is None else bisect.bisect_right(keys, after)
+            chosen = keys[start:start + limit]
+            rows = [self._rows[k if order == 'id' else k[1]] for k in chosen]
+            next_key = chosen[-1] if chosen and start + limit < len(keys) else None
+            return rows, len(ids), next_key
+
+    def _search_ids(self, customer, product, date_from, date_to):
+        with self._lock:
+            candidates = None
+            if customer:
+                try:
+                    values = self._customers.matching(re.compile(customer))
+                except re.error:
+                    values = self._customers.containing(customer)
+                candidates = self._customers.ids_for(values)
+            if product:
+                ids = self._products.ids_for(self._products.containing(product))
+                candidates = ids if candidates is None else candidates & ids
+            if date_from or date_to:
+                lo, hi = self._date_range(date_from, date_to)
+                if candidates is None or hi - lo <= len(candidates):
+                    ids = [rid for _, rid in self._by_date[lo:hi]
+                           if candidates is None or rid in candidates]
+                else:
+                    ids = [rid for rid in candidates
+                           if date_matches(self._rows[rid].date, date_from, date_to)]
+            elif candidates is None:
+                return list(self._ids)
+            else:
+                ids = candidates
+            return sorted(ids)
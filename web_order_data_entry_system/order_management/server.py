@@ -0,0 +1,95 @@
+"""Pre-forking production server: ``web-order serve --workers N``.
+
+The parent binds the listening socket and forks the workers. Each worker
+opens the storage in shared mode (``flock`` plus change counters, see
+``SharedState``) and serves requests on its own threads. Workers that die
+are replaced; SIGTERM or Ctrl-C stops them all.
+"""
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from werkzeug.serving import make_server
+
+# A worker that exits sooner than this after starting is not restarted.
+MIN_WORKER_UPTIME_S = 1.0
+
+
+def _worker(sock, host, port):
+    import order_management.app as web
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    web.init_storage(shared=True, warm=True)
+    server = make_server(host, port, web.app, threaded=True, fd=sock.fileno())
+    # Let requests in flight finish when the worker is stopped.
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def stop(*_):
+        # Open change streams would otherwise keep the worker from exiting.
+        web.change_feed.close()
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve(host='127.0.0.1', port=5001, workers=None):
+    if not hasattr(os, 'fork'):
+        sys.exit('serve 需要支持 fork 的系统（Linux/macOS）')
+    workers = max(1, workers or os.cpu_count() or 1)
+    sock = socket.create_server((host, port), backlog=128)
+    sock.set_inheritable(True)
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _worker(sock, host, port)
+            except BaseException:  # noqa: BLE001
+                # Whatever went wrong, the forked child must not return
+                # into the parent's loop: it leaves through os._exit.
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    print(f' * Serving on http://{host}:{port} with {workers} worker processes', flush=True)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+        if time.monotonic() - started < MIN_WORKER_UPTIME_S:
+            print(f' * Worker {pid} exited during startup, stopping', file=sys.stderr, flush=True)
+            stop(None, None)
+        else:
+            print(f' * Worker {pid} exited with status {status}, restarting', file=sys.stderr, flush=True)
+            spawn()
+    sock.close()
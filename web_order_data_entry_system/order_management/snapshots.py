@@ -0,0 +1,152 @@
+import marshal
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import partial
+
+from order_management.cache import table_cache
+from order_management.metrics import phase
+
+# Seconds between a change to a table and its snapshot being refreshed, so
+# a burst of writes costs one snapshot.
+SNAPSHOT_DELAY_S = 5.0
+
+# Bump when the file layout or the way records are parsed changes: older
+# snapshots are then ignored and rewritten.
+_MAGIC = b'WOSNAP01'
+# Magic, then the CSV file's mtime (ns) and size the rows were read at.
+_HEADER = struct.Struct('<8sqq')
+
+
+class Snapshots:
+    """Binary copies of parsed CSV files, so a restart need not parse them.
+
+    ``<directory>/<path of the CSV under root>.snap`` holds the rows of one
+    CSV file as marshalled columns (see ``Record.columns``), stamped with
+    the mtime and size the file had when they were read. ``load`` maps the
+    snapshot and returns its rows only while the CSV still has that stamp,
+    the same check ``TableCache`` makes; any other snapshot is ignored and
+    the CSV is parsed as before.
+
+    Snapshots are written by a background thread only, from rows already in
+    ``table_cache``: a table given to ``watch`` is snapshotted ``delay``
+    seconds after it changes or is parsed, for every file whose snapshot
+    does not match. Several processes may write the same snapshot; the
+    last complete one wins.
+    """
+
+    def __init__(self, root, directory, delay=SNAPSHOT_DELAY_S):
+        self.root = root
+        self.directory = directory
+        self.delay = delay
+        self.loads = 0
+        self.writes = 0
+        self._due = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def path(self, filepath):
+        return os.path.join(self.directory, os.path.relpath(filepath, self.root) + '.snap')
+
+    def load(self, filepath, record, st):
+        """Rows of the CSV file at stat ``st`` as ``record`` instances, or
+        None when there is no current snapshot of it.
+        """
+        with phase('read_snapshot'):
+            try:
+                with open(self.path(filepath), 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    magic, mtime, size = _HEADER.unpack_from(mm)
+                    if magic != _MAGIC or (mtime, size) != (st.st_mtime_ns, st.st_size):
+                        return None
+                    with memoryview(mm) as view, view[_HEADER.size:] as body:
+                        fields, columns = marshal.loads(body)
+            except (OSError, ValueError, EOFError, TypeError, struct.error):
+                return None
+            if tuple(fields) != record.fields:
+                return None
+            rows = record.from_columns(columns)
+        with self._cond:
+            self.loads += 1
+        return rows
+
+    def save(self, filepath, record, rows, mtime, size):
+        """Write the snapshot of ``rows``, read from the CSV file when it
+        had ``mtime`` and ``size``.
+        """
+        path = self.path(filepath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, mtime, size))
+            marshal.dump((record.fields, record.columns(rows)), f)
+        os.replace(tmp, path)
+        with self._cond:
+            self.writes += 1
+
+    def _stamp(self, filepath):
+        # ``(mtime, size)`` the snapshot on disk was taken at, or None.
+        try:
+            with open(self.path(filepath), 'rb') as f:
+                magic, mtime, size = _HEADER.unpack(f.read(_HEADER.size))
+        except (OSError, struct.error):
+            return None
+        return (mtime, size) if magic == _MAGIC else None
+
+    def watch(self, table):
+        """Keep snapshots of ``table.files()`` current."""
+        table.subscribe(partial(self._changed, table))
+
+    def _changed(self, table, event, old, new):
+        # Runs under the table's lock: only note the table as due.
+        with self._cond:
+            self._due.setdefault(table, time.monotonic() + self.delay)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='snapshots', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._due)
+                table, due = min(self._due.items(), key=lambda item: item[1])
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                del self._due[table]
+            self.snapshot(table)
+
+    def flush(self):
+        """Snapshot every table with changes pending, now."""
+        with self._cond:
+            tables = list(self._due)
+            self._due.clear()
+        for table in tables:
+            self.snapshot(table)
+
+    def snapshot(self, table):
+        """Write the snapshots of the table's files that are out of date.
+
+        Only rows already in ``table_cache`` are written; a file that is
+        not cached is left alone. A snapshot is only a cache, so failing to
+        write one is not an error.
+        """
+        for filepath in table.files():
+            entry = table_cache.stamped(filepath)
+            if entry is None:
+                continue
+            rows, mtime, size = entry
+            if self._stamp(filepath) == (mtime, size):
+                continue
+            try:
+                self.save(filepath, table.record, rows, mtime, size)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {'loads': self.loads, 'writes': self.writes, 'pending': len(self._due)}
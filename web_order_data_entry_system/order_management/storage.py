@@ -0,0 +1,1010 @@
+import bisect
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from contextlib import ExitStack, contextmanager
+from operator import attrgetter
+
+from order_management.cache import table_cache
+from order_management.locks import RWLock, SharedState
+from order_management.metrics import phase
+from order_management.records import Customer, Order, PriceList, Product
+from order_management.search import date_matches
+from order_management.snapshots import Snapshots
+
+PRICE_LISTS_FIELDS = list(PriceList.fields)
+PRODUCTS_FIELDS = list(Product.fields)
+CUSTOMERS_FIELDS = list(Customer.fields)
+ORDERS_FIELDS = list(Order.fields)
+
+TABLES = {
+    'price_lists': PRICE_LISTS_FIELDS,
+    'products': PRODUCTS_FIELDS,
+    'customers': CUSTOMERS_FIELDS,
+    'orders': ORDERS_FIELDS,
+}
+
+# Tables the CSV backend splits into month partitions.
+PARTITIONED = {'orders'}
+
+RECORDS = {
+    'price_lists': PriceList,
+    'products': Product,
+    'customers': Customer,
+    'orders': Order,
+}
+
+
+# --- CSV files ---
+
+def read_csv(filepath, record, on_load=None, lock=None, snapshots=None):
+    # Returns ``record`` instances, shared with the table cache. ``on_load``
+    # is called with the rows whenever the file is actually parsed. A cache
+    # hit takes no lock; parsing the file holds the read side of ``lock`` so
+    # an append in progress is never seen, and the cache's loading lock so
+    # readers that miss together, e.g. a request and the startup warm-up,
+    # parse it once. A current snapshot in ``snapshots`` is loaded instead
+    # of parsing the file.
+    with phase('read_csv'):
+        rows = table_cache.get(filepath)
+        if rows is not None:
+            return rows
+        if lock is None:
+            return _parse_csv(filepath, record, on_load, snapshots)
+        with lock.read(), table_cache.loading(filepath):
+            rows = table_cache.get(filepath)
+            return rows if rows is not None else _parse_csv(filepath, record, on_load, snapshots)
+
+
+def _parse_csv(filepath, record, on_load, snapshots=None):
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return []
+    rows = None if snapshots is None else snapshots.load(filepath, record, st)
+    if rows is None:
+        with open(filepath, 'r', newline='', encoding='utf-8') as f:
+            st = os.fstat(f.fileno())
+            reader = csv.reader(f)
+            header = next(reader, [])
+            rows = _parse_rows(record, reader, header)
+    table_cache.put(filepath, rows, st)
+    if on_load is not None:
+        on_load(rows)
+    return list(rows)
+
+
+def write_csv(filepath, record, rows):
+    """Replace a CSV file atomically: readers see the old or the new file."""
+    tmp = filepath + '.tmp'
+    with phase('write_csv'):
+        with open(tmp, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=record.fields, restval='', extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filepath)
+        table_cache.put(filepath, _as_read(record, rows), os.stat(filepath))
+
+
+def append_csv(filepath, record, rows):
+    """Append rows to the end of a CSV file with a single fsync."""
+    with phase('write_csv'), open(filepath, 'a+', newline='', encoding='utf-8') as f:
+        before = os.fstat(f.fileno())
+        writer = csv.DictWriter(f, fieldnames=record.fields, restval='', extrasaction='ignore')
+        if before.st_size == 0:
+            writer.writeheader()
+        elif not _ends_with_newline(filepath):
+            f.write('\r\n')
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+        after = os.fstat(f.fileno())
+    table_cache.extend(filepath, _as_read(record, rows), before, after)
+
+
+def _read_appended(filepath, record, cached):
+    """Parse what was appended to a file after the cached ``(rows, size)``
+    and extend the cache entry with it. Returns the new rows.
+    """
+    rows, size = cached
+    with open(filepath, 'rb') as f:
+        f.seek(size)
+        tail = f.read().decode('utf-8')
+        st = os.fstat(f.fileno())
+    new = _parse_rows(record, csv.reader(io.StringIO(tail, newline='')))
+    table_cache.put(filepath, rows + new, st)
+    return new
+
+
+def _ends_with_newline(filepath):
+    with open(filepath, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _parse_rows(record, reader, header=None):
+    # Cells are picked by the header's column names, like csv.DictReader;
+    # without a header they are in ``record.fields`` order. Blank lines are
+    # skipped.
+    if header is None or list(header) == list(record.fields):
+        return [record.parse(cells) for cells in reader if cells]
+    columns = [header.index(f) if f in header else len(header) for f in record.fields]
+    return [record.parse([cells[i] if i < len(cells) else '' for i in columns])
+            for cells in reader if cells]
+
+
+def _as_read(record, rows):
+    # What reading the rows just written back from the file would return.
+    return [record.from_row(r) for r in rows]
+
+
+class IdSequence:
+    """Next-id counter kept in a small sidecar file next to a CSV table.
+
+    Recovered as ``max(sidecar, max id + 1)`` whenever the table is parsed,
+    so a stale or missing sidecar never hands out an id that is in use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.next = None
+        self._lock = threading.Lock()
+
+    def recover(self, rows):
+        top = max((r.id for r in rows), default=0) + 1
+        with self._lock:
+            self.next = max(top, self._read(), self.next or 0)
+
+    def allocate(self, n):
+        """Reserve ``n`` consecutive ids and return the first one."""
+        with self._lock:
+            start = self.next
+            self.next += n
+            self._write(self.next)
+        return start
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return 0
+
+    def _write(self, value):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(str(value))
+        os.replace(tmp, self.path)
+
+
+# --- Repositories ---
+
+class Table:
+    """One entity table.
+
+    Rows come back as instances of the table's ``Record`` class
+    (``RECORDS``), which read like dicts of strings. ``insert`` and
+    ``insert_many`` take plain dicts, assign ids and return the rows they
+    were given with an integer ``id`` added in front.
+
+    Listeners registered with ``subscribe`` are called as
+    ``listener(event, old_rows, new_rows)`` after every change, with event
+    ``'insert'``, ``'update'`` or ``'delete'``. ``'reset'`` (with no rows)
+    means the table was reloaded from outside and derived state must be
+    rebuilt. Listeners run while the table's write lock is held, so they
+    must not wait on anything that reads the table.
+
+    Every change holds the write side of ``lock``; reads do not block
+    behind it.
+
+    When several processes share the data, ``shared`` is the table's
+    ``SharedState``: writes also lock across processes and bump its
+    counters, and ``sync`` replays what other processes changed.
+    """
+
+    def __init__(self, name, fields, shared=None):
+        self.name = name
+        self.fields = fields
+        self.record = RECORDS[name]
+        self.listeners = []
+        self.shared = shared
+        self.lock = RWLock(shared)
+        self._seen = shared.read() if shared else None
+        self._token = uuid.uuid4().hex[:8]
+        self._writes = 0
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def _emit(self, event, old=(), new=()):
+        if not self.listeners:
+            return
+        new = _as_read(self.record, new)
+        for listener in self.listeners:
+            listener(event, list(old), new)
+
+    def sync(self):
+        """Catch up with changes other processes made to the table."""
+        if self.shared is None or self.shared.read() == self._seen:
+            return
+        with self.lock.write():
+            seen = self.shared.read()
+            if seen != self._seen:
+                self._reload(append_only=seen[1] == self._seen[1])
+                self._seen = seen
+
+    def _reload(self, append_only):
+        self._emit('reset')
+
+    def _committed(self, rewrite=False):
+        self._writes += 1
+        if self.shared is not None:
+            self._seen = self.shared.bump(rewrite)
+
+    def version(self):
+        """Return ``(tag, mtime)`` for HTTP validators.
+
+        ``tag`` changes with every write to the table; ``mtime`` is the
+        time of the last change as a timestamp, or None when unknown.
+        """
+        if self.shared is not None:
+            return f'{self.shared.ident:x}.{self.shared.read()[0]:x}', None
+        return f'{self._token}.{self._writes:x}', None
+
+    def all(self):
+        raise NotImplementedError
+
+    def between(self, date_from='', date_to=''):
+        """Rows whose ``date`` passes ``date_matches``, in id order."""
+        return [r for r in self.all() if date_matches(r.date, date_from, date_to)]
+
+    def insert(self, row):
+        return self.insert_many([row])[0]
+
+    def insert_many(self, rows):
+        raise NotImplementedError
+
+    def update(self, row):
+        raise NotImplementedError
+
+    def delete(self, rid):
+        raise NotImplementedError
+
+    def batch(self, inserts=(), updates=(), deletes=()):
+        """Insert, update and delete rows in one write.
+
+        ``updates`` are full rows with their ``id``, ``deletes`` are ids; an
+        id both updated and deleted is deleted. Returns ``(inserted,
+        updated, deleted)``: the inserted rows with their ids, and the ids
+        of the rows that were found and changed.
+        """
+        raise NotImplementedError
+
+
+def _numbered(table, rows):
+    # New rows with ids from the table's sequence, in order.
+    if table.ids.next is None:
+        table.ids.recover(table.all())
+    start = table.ids.allocate(len(rows))
+    return [{'id': start + i, **row} for i, row in enumerate(rows)]
+
+
+class CsvTable(Table):
+    def __init__(self, name, fields, filepath, shared=None, snapshots=None):
+        super().__init__(name, fields, shared)
+        self.filepath = filepath
+        self.snapshots = snapshots
+        self.ids = IdSequence(os.path.splitext(filepath)[0] + '.seq')
+
+    def files(self):
+        """Paths of the CSV files holding the table."""
+        return [self.filepath]
+
+    def all(self):
+        return read_csv(self.filepath, self.record, on_load=self._loaded, lock=self.lock,
+                        snapshots=self.snapshots)
+
+    def _loaded(self, rows):
+        self.ids.recover(rows)
+        self._emit('reset')
+
+    def version(self):
+        # Writes append (new size) or os.replace the file (new inode), so
+        # the file's stat changes with every write, from any process.
+        try:
+            st = os.stat(self.filepath)
+        except FileNotFoundError:
+            return 'empty', None
+        return f'{st.st_ino:x}.{st.st_mtime_ns:x}.{st.st_size:x}', st.st_mtime
+
+    def _reload(self, append_only):
+        # Rows appended by another process are read from where the cached
+        # copy ends; anything else reloads the whole file.
+        cached = table_cache.peek(self.filepath)
+        if not append_only or cached is None or not cached[1]:
+            table_cache.invalidate(self.filepath)
+            self.all()
+            return
+        new = _read_appended(self.filepath, self.record, cached)
+        self.ids.recover(new)
+        self._emit('insert', new=new)
+
+    def insert_many(self, rows):
+        if not rows:
+            return []
+        with self.lock.write():
+            self.sync()
+            rows = _numbered(self, rows)
+            append_csv(self.filepath, self.record, rows)
+            self._committed()
+            self._emit('insert', new=rows)
+        return rows
+
+    def update(self, row):
+        rid = int(row['id'])
+        with self.lock.write():
+            self.sync()
+            rows = self.all()
+            for i, r in enumerate(rows):
+                if r.id == rid:
+                    rows[i] = row
+                    write_csv(self.filepath, self.record, rows)
+                    self._committed(rewrite=True)
+                    self._emit('update', [r], [row])
+                    return True
+        return False
+
+    def delete(self, rid):
+        kept, removed = [], []
+        with self.lock.write():
+            self.sync()
+            for r in self.all():
+                (removed if r.id == rid else kept).append(r)
+            if removed:
+                write_csv(self.filepath, self.record, kept)
+                self._committed(rewrite=True)
+                self._emit('delete', removed)
+        return bool(removed)
+
+    def batch(self, inserts=(), updates=(), deletes=()):
+        changes = {int(row['id']): row for row in updates}
+        deletes = set(deletes)
+        with self.lock.write():
+            self.sync()
+            if not changes and not deletes:
+                return self.insert_many(list(inserts)), [], []
+            old, new, kept, removed = [], [], [], []
+            for r in self.all():
+                if r.id in deletes:
+                    removed.append(r)
+                    continue
+                row = changes.get(r.id)
+                if row is not None:
+                    old.append(r)
+                    new.append(row)
+                    r = row
+                kept.append(r)
+            inserts = _numbered(self, list(inserts)) if inserts else []
+            if old or removed:
+                write_csv(self.filepath, self.record, kept + inserts)
+            elif inserts:
+                append_csv(self.filepath, self.record, inserts)
+            if old or removed or inserts:
+                self._committed(rewrite=bool(old or removed))
+            if old:
+                self._emit('update', old, new)
+            if removed:
+                self._emit('delete', removed)
+            if inserts:
+                self._emit('insert', new=inserts)
+        return inserts, [r.id for r in old], [r.id for r in removed]
+
+
+# --- Month partitions ---
+
+PARTITION_OTHER = 'other'
+_MONTH = re.compile(r'\d{4}-\d{2}$')
+_by_id = attrgetter('id')
+
+
+def partition_of(date):
+    """Partition an order date is filed under: its ``YYYY-MM`` month, or
+    ``'other'`` when the date does not start with one.
+    """
+    month = (date or '')[:7]
+    return month if _MONTH.match(month) else PARTITION_OTHER
+
+
+def partition_overlaps(name, date_from='', date_to=''):
+    """Whether partition ``name`` can hold a date that passes
+    ``date_matches(date, date_from, date_to)``.
+    """
+    if name == PARTITION_OTHER:
+        return True
+    if date_from and name < date_from[:7]:
+        return False
+    if date_to:
+        # YYYY and YYYY-MM upper bounds include the whole year/month.
+        n = len(date_to) if len(date_to) in (4, 7) else 7
+        return name[:n] <= date_to[:n]
+    return True
+
+
+class PartitionedCsvTable(Table):
+    """A table kept as one CSV file per month, ``<directory>/2025-09.csv``.
+
+    Rows are filed by ``partition_of(row['date'])`` and ``manifest.json``
+    in the directory lists the partitions. Appends go to the row's
+    partition; updates and deletes rewrite only the partitions they touch,
+    and ``between`` reads only the partitions a date range can match.
+    ``all`` returns the rows of every partition in id order.
+
+    A flat ``<directory>.csv`` from before partitioning is split up the
+    first time the table is opened and kept as ``<directory>.csv.migrated``.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, name, fields, directory, shared=None, snapshots=None):
+        super().__init__(name, fields, shared)
+        self.directory = directory
+        self.snapshots = snapshots
+        self.manifest_path = os.path.join(directory, self.MANIFEST)
+        self.ids = IdSequence(directory + '.seq')
+        self._manifest = (None, [])
+        os.makedirs(directory, exist_ok=True)
+        self._migrate(directory + '.csv')
+        # Partitions this process has seen in the manifest or read. Only a
+        # partition missing from here is new to the listeners on a sync.
+        self._known = set(self.partitions())
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.csv')
+
+    def files(self):
+        """Paths of the CSV files holding the table, one per partition."""
+        return [self._path(name) for name in self.partitions()]
+
+    def partitions(self):
+        """Names of the partitions, oldest month first."""
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return []
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self._manifest[0] != key:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self._manifest = (key, json.load(f)['partitions'])
+        return list(self._manifest[1])
+
+    def _write_manifest(self, names):
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'partitions': sorted(names)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+
+    def _migrate(self, legacy):
+        if os.path.exists(self.manifest_path) or not os.path.exists(legacy):
+            return
+        with self.lock.write():
+            if os.path.exists(self.manifest_path) or not os.path.exists(legacy):
+                return
+            groups = {}
+            for r in sorted(read_csv(legacy, self.record), key=_by_id):
+                groups.setdefault(partition_of(r.date), []).append(r)
+            for name, rows in groups.items():
+                write_csv(self._path(name), self.record, rows)
+            self._write_manifest(groups)
+            os.replace(legacy, legacy + '.migrated')
+            table_cache.invalidate(legacy)
+            self._committed(rewrite=True)
+
+    def _read(self, name):
+        return read_csv(self._path(name), self.record, on_load=self._loaded, lock=self.lock,
+                        snapshots=self.snapshots)
+
+    def _loaded(self, rows):
+        self.ids.recover(rows)
+        self._emit('reset')
+
+    def all(self):
+        # The read lock keeps a row that moves between partitions from
+        # being seen twice or not at all.
+        with self.lock.read():
+            names = self.partitions()
+            rows = []
+            for name in names:
+                rows += self._read(name)
+            self._known.update(names)
+        rows.sort(key=_by_id)
+        return rows
+
+    def between(self, date_from='', date_to=''):
+        """Rows whose date passes ``date_matches``, in id order.
+
+        Partitions outside the date range are not read at all.
+        """
+        with self.lock.read():
+            names = [name for name in self.partitions() if partition_overlaps(name, date_from, date_to)]
+            rows = [r for name in names for r in self._read(name) if date_matches(r.date, date_from, date_to)]
+            self._known.update(names)
+        rows.sort(key=_by_id)
+        return rows
+
+    def version(self):
+        paths = [self.manifest_path] + [self._path(name) for name in self.partitions()]
+        stats = []
+        for path in paths:
+            try:
+                stats.append((os.path.basename(path), os.stat(path)))
+            except FileNotFoundError:
+                pass
+        if not stats:
+            return 'empty', None
+        key = '\n'.join(f'{n}.{st.st_ino:x}.{st.st_mtime_ns:x}.{st.st_size:x}' for n, st in stats)
+        return (hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest(),
+                max(st.st_mtime for _, st in stats))
+
+    def _reload(self, append_only):
+        # Rows appended by another process are read from where each cached
+        # partition ends, and a partition new to the manifest is read whole.
+        # A known partition that is not cached has not been handed to the
+        # listeners, so it is left to be read when it is asked for.
+        # Anything else reloads every partition.
+        names = self.partitions()
+        new = []
+        if append_only:
+            for name in names:
+                cached = table_cache.peek(self._path(name))
+                if name not in self._known:
+                    new += _parse_csv(self._path(name), self.record, None, self.snapshots)
+                elif cached is None:
+                    continue
+                elif not cached[1]:
+                    append_only = False
+                    break
+                else:
+                    new += _read_appended(self._path(name), self.record, cached)
+        self._known = set(names)
+        if not append_only:
+            for name in names:
+                table_cache.invalidate(self._path(name))
+            self._emit('reset')
+            self.all()
+            return
+        if new:
+            self.ids.recover(new)
+            self._emit('insert', new=new)
+
+    def _locate(self, rid):
+        # Recent orders are the ones edited most; look there first.
+        for name in reversed(self.partitions()):
+            rows = self._read(name)
+            for i, r in enumerate(rows):
+                if r.id == rid:
+                    return name, rows, i
+        return None, None, None
+
+    def _store(self, name, rows):
+        # Rewrite one partition; an emptied partition is dropped.
+        if rows:
+            write_csv(self._path(name), self.record, rows)
+            return
+        self._write_manifest(n for n in self.partitions() if n != name)
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+        table_cache.invalidate(self._path(name))
+
+    def _add_partitions(self, names):
+        listed = self.partitions()
+        if not set(names) <= set(listed):
+            # Listed before any row is written, so a crash never leaves rows
+            # in a file the manifest does not name.
+            self._write_manifest(set(listed) | set(names))
+        self._known.update(names)
+
+    def insert_many(self, rows):
+        if not rows:
+            return []
+        with self.lock.write():
+            self.sync()
+            rows = _numbered(self, rows)
+            groups = {}
+            for r in rows:
+                groups.setdefault(partition_of(str(r.get('date') or '')), []).append(r)
+            self._add_partitions(groups)
+            for name, group in groups.items():
+                append_csv(self._path(name), self.record, group)
+            self._committed()
+            self._emit('insert', new=rows)
+        return rows
+
+    def update(self, row):
+        rid = int(row['id'])
+        with self.lock.write():
+            self.sync()
+            name, rows, i = self._locate(rid)
+            if name is None:
+                return False
+            old = rows[i]
+            target = partition_of(str(row.get('date') or ''))
+            if target == name:
+                rows[i] = row
+                self._store(name, rows)
+            else:
+                # The date moved to another month: the row moves with it.
+                self._add_partitions([target])
+                moved = self._read(target)
+                moved.insert(bisect.bisect_right(moved, rid, key=_by_id), self.record.from_row(row))
+                self._store(target, moved)
+                del rows[i]
+                self._store(name, rows)
+            self._committed(rewrite=True)
+            self._emit('update', [old], [row])
+        return True
+
+    def delete(self, rid):
+        with self.lock.write():
+            self.sync()
+            name, rows, i = self._locate(rid)
+            if name is None:
+                return False
+            old = rows.pop(i)
+            self._store(name, rows)
+            self._committed(rewrite=True)
+            self._emit('delete', [old])
+        return True
+
+    def batch(self, inserts=(), updates=(), deletes=()):
+        # Every partition holding a changed row is rewritten once; inserts
+        # into partitions that are not rewritten are appended.
+        changes = {int(row['id']): row for row in updates}
+        deletes = set(deletes)
+        with self.lock.write():
+            self.sync()
+            inserts = _numbered(self, list(inserts)) if inserts else []
+            old, new, removed, moved = [], [], [], []
+            rewrite = {}
+            pending = len(changes.keys() | deletes)
+            # Updates mostly keep their date, so their month is looked at
+            # first and the search stops once every row is found.
+            hinted = {partition_of(str(row.get('date') or '')) for row in changes.values()}
+            names = self.partitions()[::-1]
+            names = [n for n in names if n in hinted] + [n for n in names if n not in hinted]
+            for name in names:
+                if not pending:
+                    break
+                kept, hit = [], False
+                for r in self._read(name):
+                    if r.id in deletes:
+                        removed.append(r)
+                    elif r.id in changes:
+                        row = changes[r.id]
+                        old.append(r)
+                        new.append(row)
+                        target = partition_of(str(row.get('date') or ''))
+                        if target == name:
+                            kept.append(self.record.from_row(row))
+                        else:
+                            # The date moved to another month: the row moves with it.
+                            moved.append((target, row))
+                    else:
+                        kept.append(r)
+                        continue
+                    hit = True
+                    pending -= 1
+                if hit:
+                    rewrite[name] = kept
+            appends = {}
+            for target, row in moved:
+                rows = rewrite.get(target)
+                if rows is None:
+                    rows = rewrite[target] = self._read(target) if target in self.partitions() else []
+                rows.insert(bisect.bisect_right(rows, int(row['id']), key=_by_id), self.record.from_row(row))
+            for row in inserts:
+                target = partition_of(str(row.get('date') or ''))
+                # New ids are the highest, so they go at the end.
+                (rewrite[target] if target in rewrite else appends.setdefault(target, [])).append(row)
+            self._add_partitions([t for t, _ in moved] + list(appends)
+                                 + [n for n, rows in rewrite.items() if rows])
+            for name, rows in rewrite.items():
+                self._store(name, rows)
+            for name, rows in appends.items():
+                append_csv(self._path(name), self.record, rows)
+            if rewrite or appends:
+                self._committed(rewrite=bool(rewrite))
+            if old:
+                self._emit('update', old, new)
+            if removed:
+                self._emit('delete', removed)
+            if inserts:
+                self._emit('insert', new=inserts)
+        return inserts, [r.id for r in old], [r.id for r in removed]
+
+
+class SqliteTable(Table):
+    def __init__(self, name, fields, db, shared=None):
+        super().__init__(name, fields, shared)
+        self.db = db
+        self._columns = ', '.join(fields)
+        self._data_fields = fields[1:]
+
+    def _row(self, values):
+        return self.record.parse(values)
+
+    def all(self):
+        cur = self.db.conn().execute(f'SELECT {self._columns} FROM {self.name} ORDER BY id')
+        return [self._row(v) for v in cur]
+
+    def _get(self, rid):
+        cur = self.db.conn().execute(f'SELECT {self._columns} FROM {self.name} WHERE id = ?', (rid,))
+        values = cur.fetchone()
+        return self._row(values) if values else None
+
+    def insert_many(self, rows):
+        if not rows:
+            return []
+        conn = self.db.conn()
+        with self.lock.write():
+            self.sync()
+            with conn:
+                rows = self._insert(conn, rows)
+            self._committed()
+            self._emit('insert', new=rows)
+        return rows
+
+    def _insert(self, conn, rows):
+        # The UPDATE takes the write lock before the sequence is read.
+        conn.execute('UPDATE id_sequences SET next_id = next_id + ? WHERE name = ?',
+                     (len(rows), self.name))
+        start = conn.execute('SELECT next_id FROM id_sequences WHERE name = ?',
+                             (self.name,)).fetchone()[0] - len(rows)
+        rows = [{'id': start + i, **row} for i, row in enumerate(rows)]
+        placeholders = ', '.join('?' * len(self.fields))
+        conn.executemany(f'INSERT INTO {self.name} ({self._columns}) VALUES ({placeholders})',
+                         [self._values(r) for r in rows])
+        return rows
+
+    def update(self, row):
+        assignments = ', '.join(f'{k} = ?' for k in self._data_fields)
+        conn = self.db.conn()
+        with self.lock.write():
+            self.sync()
+            old = self._get(int(row['id'])) if self.listeners else None
+            with conn:
+                cur = conn.execute(f'UPDATE {self.name} SET {assignments} WHERE id = ?',
+                                   self._values(row)[1:] + [int(row['id'])])
+            if cur.rowcount:
+                self._committed()
+            if cur.rowcount and old:
+                self._emit('update', [old], [row])
+        return cur.rowcount > 0
+
+    def delete(self, rid):
+        conn = self.db.conn()
+        with self.lock.write():
+            self.sync()
+            with conn:
+                old = self._get(rid) if self.listeners else None
+                cur = conn.execute(f'DELETE FROM {self.name} WHERE id = ?', (rid,))
+            if cur.rowcount:
+                self._committed()
+            if cur.rowcount and old:
+                self._emit('delete', [old])
+        return cur.rowcount > 0
+
+    def batch(self, inserts=(), updates=(), deletes=()):
+        # One transaction for the whole batch.
+        assignments = ', '.join(f'{k} = ?' for k in self._data_fields)
+        deletes = list(dict.fromkeys(deletes))
+        gone = set(deletes)
+        updates = [row for row in updates if int(row['id']) not in gone]
+        conn = self.db.conn()
+        with self.lock.write():
+            self.sync()
+            before = {}
+            if self.listeners:
+                for rid in [int(row['id']) for row in updates] + deletes:
+                    before[rid] = self._get(rid)
+            updated, deleted = [], []
+            with conn:
+                inserts = self._insert(conn, list(inserts)) if inserts else []
+                for row in updates:
+                    cur = conn.execute(f'UPDATE {self.name} SET {assignments} WHERE id = ?',
+                                       self._values(row)[1:] + [int(row['id'])])
+                    if cur.rowcount:
+                        updated.append(row)
+                for rid in deletes:
+                    if conn.execute(f'DELETE FROM {self.name} WHERE id = ?', (rid,)).rowcount:
+                        deleted.append(rid)
+            if updated or deleted or inserts:
+                self._committed()
+            if updated and self.listeners:
+                self._emit('update', [before[int(row['id'])] for row in updated], updated)
+            if deleted and self.listeners:
+                self._emit('delete', [before[rid] for rid in deleted])
+            if inserts:
+                self._emit('insert', new=inserts)
+        return inserts, [int(row['id']) for row in updated], deleted
+
+    def recover_ids(self):
+        conn = self.db.conn()
+        with conn:
+            conn.execute('INSERT OR IGNORE INTO id_sequences (name, next_id) VALUES (?, 1)', (self.name,))
+            conn.execute(
+                f'UPDATE id_sequences SET next_id = MAX(next_id, '
+                f'(SELECT COALESCE(MAX(id), 0) + 1 FROM {self.name})) WHERE name = ?', (self.name,))
+
+    def _values(self, row):
+        values = ['' if row.get(k) is None else str(row[k]) for k in self.fields]
+        values[0] = int(row['id'])
+        return values
+
+
+# --- Storage backends ---
+
+def _shared_state(data_dir, name, shared):
+    return SharedState(os.path.join(data_dir, f'{name}.lock')) if shared else None
+
+
+class Storage:
+    snapshots = None
+
+    def warm(self):
+        """Load the tables ahead of the first request that needs them."""
+
+    def sync(self):
+        """Bring every table up to date with changes from other processes."""
+        for name in TABLES:
+            getattr(self, name).sync()
+
+    @contextmanager
+    def locked(self, *names):
+        """Hold the write locks of the named tables for a read-check-write.
+
+        Locks are always taken in ``TABLES`` order, so two callers locking
+        overlapping tables cannot deadlock.
+        """
+        with ExitStack() as stack:
+            for name in TABLES:
+                if name in names:
+                    stack.enter_context(getattr(self, name).lock.write())
+            yield
+
+
+class CsvStorage(Storage):
+    """CSV files in ``data_dir``.
+
+    With ``snapshots`` the parsed tables are also kept as binary snapshots
+    in ``<data_dir>/snapshots`` (see ``Snapshots``), and a restarted
+    process loads those instead of parsing the CSV files again.
+    """
+
+    backend = 'csv'
+
+    def __init__(self, data_dir, shared=False, snapshots=False):
+        self.data_dir = data_dir
+        if snapshots:
+            self.snapshots = Snapshots(data_dir, os.path.join(data_dir, 'snapshots'))
+        for name, fields in TABLES.items():
+            state = _shared_state(data_dir, name, shared)
+            if name in PARTITIONED:
+                table = PartitionedCsvTable(name, fields, os.path.join(data_dir, name), state,
+                                            self.snapshots)
+            else:
+                table = CsvTable(name, fields, os.path.join(data_dir, f'{name}.csv'), state,
+                                 self.snapshots)
+            if self.snapshots is not None:
+                self.snapshots.watch(table)
+            setattr(self, name, table)
+
+    def warm(self):
+        for name in TABLES:
+            getattr(self, name).all()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_lists (
+    id INTEGER PRIMARY KEY, name TEXT NOT NULL DEFAULT '');
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY, list_id TEXT NOT NULL DEFAULT '', name TEXT NOT NULL DEFAULT '',
+    unit TEXT NOT NULL DEFAULT '', price TEXT NOT NULL DEFAULT '');
+CREATE TABLE IF NOT EXISTS customers (
+    id INTEGER PRIMARY KEY, name TEXT NOT NULL DEFAULT '', list_id TEXT NOT NULL DEFAULT '');
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY, date TEXT NOT NULL DEFAULT '', customer TEXT NOT NULL DEFAULT '',
+    product TEXT NOT NULL DEFAULT '', unit TEXT NOT NULL DEFAULT '', price TEXT NOT NULL DEFAULT '',
+    quantity TEXT NOT NULL DEFAULT '', total TEXT NOT NULL DEFAULT '');
+CREATE TABLE IF NOT EXISTS id_sequences (
+    name TEXT PRIMARY KEY, next_id INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_orders_date ON orders (date);
+CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer);
+CREATE INDEX IF NOT EXISTS idx_products_list ON products (list_id, name, unit);
+"""
+
+
+class SqliteStorage(Storage):
+    """SQLite database in WAL mode, one connection per thread.
+
+    A newly created database is filled once from the CSV files in
+    ``data_dir`` (see ``migrate_csv``). SQLite already locks across
+    processes; ``shared`` adds the change counters that keep each process's
+    derived indexes current.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, db_path, data_dir=None, shared=False):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        fresh = not os.path.exists(db_path)
+        conn = self.conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SQLITE_SCHEMA)
+        state_dir = os.path.dirname(os.path.abspath(db_path))
+        for name, fields in TABLES.items():
+            setattr(self, name, SqliteTable(name, fields, self, _shared_state(state_dir, name, shared)))
+        if fresh and data_dir:
+            migrate_csv(data_dir, self)
+        for name in TABLES:
+            getattr(self, name).recover_ids()
+
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+
+def migrate_csv(data_dir, storage):
+    """Load the CSV tables in ``data_dir`` into ``storage``, keeping ids.
+
+    Returns the number of rows copied per table.
+    """
+    conn = storage.conn()
+    counts = {}
+    with conn:
+        for name, fields in TABLES.items():
+            table = getattr(storage, name)
+            rows = _read_csv_table(data_dir, name)
+            conn.execute(f'DELETE FROM {name}')
+            conn.executemany(
+                f'INSERT INTO {name} ({", ".join(fields)}) VALUES ({", ".join("?" * len(fields))})',
+                [table._values(r) for r in rows])
+            counts[name] = len(rows)
+    return counts
+
+
+def _read_csv_table(data_dir, name):
+    directory = os.path.join(data_dir, name)
+    if name in PARTITIONED and os.path.exists(os.path.join(directory, PartitionedCsvTable.MANIFEST)):
+        return PartitionedCsvTable(name, TABLES[name], directory).all()
+    return read_csv(os.path.join(data_dir, f'{name}.csv'), RECORDS[name])
+
+
+def open_storage(backend, data_dir, db_path=None, shared=False, snapshots=False):
+    """Open a storage backend; ``shared`` when other processes use it too.
+
+    ``snapshots`` keeps binary snapshots of the CSV tables for faster
+    startup; the SQLite backend has no use for them.
+    """
+    if backend == 'csv':
+        return CsvStorage(data_dir, shared, snapshots)
+    if backend == 'sqlite':
+        return SqliteStorage(db_path or os.path.join(data_dir, 'orders.db'), data_dir, shared)
+    raise ValueError(f'unknown storage backend {backend!r}')
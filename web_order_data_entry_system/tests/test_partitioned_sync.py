@@ -0,0 +1,53 @@
+import multiprocessing
+
+from order_management.storage import open_storage
+
+
+def _order(date):
+    return {'date': date, 'customer': 'c', 'product': 'p', 'unit': '个',
+            'price': '1', 'quantity': '1', 'total': '1'}
+
+
+def _insert(data_dir, date):
+    open_storage('csv', data_dir, shared=True).orders.insert(_order(date))
+
+
+def _insert_in_other_process(data_dir, date):
+    p = multiprocessing.get_context('spawn').Process(target=_insert, args=(data_dir, date))
+    p.start()
+    p.join()
+    assert p.exitcode == 0
+
+
+def _open(data_dir):
+    store = open_storage('csv', data_dir, shared=True)
+    events = []
+    store.orders.subscribe(lambda event, old, new: events.append((event, [r.id for r in new])))
+    return store, events
+
+
+def test_sync_without_all_emits_only_appended_rows(tmp_path):
+    data_dir = str(tmp_path)
+    seed = open_storage('csv', data_dir, shared=True)
+    seed.orders.insert_many([_order(f'2025-0{m}-01') for m in (1, 2, 3) for _ in range(5)])
+
+    # This process never reads the orders through all().
+    store, events = _open(data_dir)
+    store.products.all()
+    _insert_in_other_process(data_dir, '2025-02-10')
+    store.sync()
+    assert events == []
+
+    # Partitions read through between() get the appended rows only.
+    store.orders.between('2025-02-01', '2025-02-28')
+    events.clear()
+    _insert_in_other_process(data_dir, '2025-02-11')
+    store.sync()
+    assert events == [('insert', [17])]
+
+    # A partition new to the manifest is read whole.
+    events.clear()
+    _insert_in_other_process(data_dir, '2025-04-01')
+    store.sync()
+    assert events == [('insert', [18])]
+    assert [r.id for r in store.orders.all()] == list(range(1, 19))